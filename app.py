@@ -0,0 +1,522 @@
+import pandas as pd
+import sqlite3
+import courses
+from courses import CoursesDB
+from importlib import reload
+import dash
+from dash import Dash, dcc, html, Input, Output, State, callback, dash_table, Patch
+from flask import Response, request
+from flask_caching import Cache
+from urllib.parse import urlparse
+import argparse
+import functools
+import json
+import os
+
+#initialize the app
+app = Dash(__name__)
+    
+app.title = 'Course Comparisons'
+server = app.server #WSGI entry point, e.g. for gunicorn
+
+db_file = 'courses.db'
+
+if os.path.exists(db_file):
+    #scraping and clearing go through writer (clearing on a staged copy, see db.staged), every query callback reads through
+    #db, which keeps one read-only connection per thread so callbacks don't open a new connection each time
+    writer = courses.CoursesDB(db_file, create = False)
+    db = courses.CoursesDB(db_file, read_only = True)
+else:
+    print("!!!!No database found. Download the courses.db file from the Github repository!!!!")
+
+#analysis results shared by all worker processes. Entries are keyed on the database's data version,
+#so a scrape or clear makes every worker recompute instead of serving stale results
+cache = Cache(server, config={
+    'CACHE_TYPE': 'FileSystemCache',
+    'CACHE_DIR': os.path.join(os.path.dirname(os.path.abspath(db_file)), '.dash_cache'),
+    'CACHE_DEFAULT_TIMEOUT': 0,
+})
+
+# use the nightly precomputed results (python courses.py precompute) when they are current
+@cache.memoize()
+def cached_compare_two_courses(course_one, course_two, data_version):
+    pairs = db.get_precomputed('pairs', course_one)
+    if pairs is not None and (pairs['race_id_two'] == course_two).any():
+        pair = pairs[pairs['race_id_two'] == course_two].drop(columns='race_id_two')
+        return pair[['Difference', 'Ratio', 'NumCompared', 'RatioSE']].reset_index(drop=True)
+    return db.compare_two_courses(course_one, course_two, standard_error=True)
+
+@cache.memoize()
+def cached_conversions(primary_race_id, data_version):
+    conversions = db.get_precomputed('conversions', primary_race_id)
+    if conversions is not None:
+        return conversions
+    return db.conversions(primary_race_id)
+
+@cache.memoize()
+def cached_predict_times(target_course_id, data_version):
+    predictions = db.get_precomputed('predictions', target_course_id)
+    if predictions is not None:
+        return predictions
+    return db.predict_times(target_course_id)
+
+@cache.memoize()
+def cached_virtual_race(schools, primary, data_version):
+    return db.virtual_race(list(schools), primary)
+
+#getting full table with all data: 
+query = '''
+SELECT runner_id, name, eligibility, school, race_id, raw_time, time, place, race, tRace.gender, date
+FROM tRunner
+JOIN tRaceResult USING (runner_id)
+JOIN tRace USING (race_id)
+;'''
+
+#same columns for newly scraped races (one per gender), used to append them to the table
+race_rows_query = '''
+SELECT runner_id, name, eligibility, school, race_id, raw_time, time, place, race, tRace.gender, date
+FROM tRunner
+JOIN tRaceResult USING (runner_id)
+JOIN tRace USING (race_id)
+WHERE race_id IN (:women_race_id, :men_race_id)
+;'''
+
+#getting unique race names from dropdown options
+race_names_query = '''
+SELECT DISTINCT race_id, race, gender
+FROM tRace
+;'''
+
+def race_label(row):
+    #the men's and women's races at a meet share a name, so show which one it is
+    return row['race'] + (f" ({row['gender'].capitalize()})" if isinstance(row['gender'], str) else '')
+
+#dropdown options for every race dropdown and the rows of the results table, only re-read when the data version changes
+race_cache = {'version': None, 'options': None}
+table_cache = {'version': None, 'frame': None}
+race_dropdowns = ['course-one-dropdown', 'course-two-dropdown', 'full-course-dropdown', 'course-dropdown', 'primary-course-dropdown']
+
+#teams dropdown options are looked up as the user types (see teams_typeahead_callback)
+#so only this many matching schools are sent to the browser at a time
+typeahead_limit = 50
+
+def current_race_options():
+    version = db.data_version()
+    if version != race_cache['version']:
+        race_data = db.run_query(race_names_query)
+        race_cache['options'] = [{'label':race_label(row), 'value':row['race_id']} for _, row in race_data.iterrows()]
+        race_cache['version'] = version
+    return race_cache['options']
+
+def current_table():
+    version = db.data_version()
+    if version != table_cache['version']:
+        table_cache['frame'] = db.run_query(query)
+        table_cache['version'] = version
+    return table_cache['frame']
+
+#Dash app layout, built for each page load so it shows the races loaded since the app started
+def serve_layout():
+    race_options = current_race_options()
+    table_frame = current_table()
+    return html.Div(
+        [
+            dcc.Tabs(
+                [
+                    dcc.Tab(
+                        label="Import Data",
+                        children=[
+                            html.H1("Race Results"),
+                            dcc.Dropdown(
+                                id='gender-dropdown',
+                                options=[
+                                    {'label':'Women', 'value':'women'},
+                                    {'label':'Men', 'value':'men'},
+                                    {'label':'Both (with team results)', 'value':'both'}
+                                ],
+                                value='women',
+                            ),
+                            dcc.Input(
+                                id='url-input',
+                                type='text',
+                                placeholder='Enter race URL...',
+                                style={'width':'60%'}
+                            ),
+                            html.Button("Scrape and Load Results", id="scrape-button"),
+                            html.Button("Clear Table", id="clear-table-button"),
+                            html.A(html.Button("Download CSV"), href="/download/results.csv"),
+                            html.Div(id="output"),
+                            html.Div(
+                                [
+                                    dash_table.DataTable(
+                                        id='race-table',
+                                        columns=[{"name":col, "id":col} for col in table_frame.columns],
+                                        data=table_frame.to_dict("records"),
+                                        style_table={"height": "500px", "overflowY": "auto"},
+                                        filter_action="native",
+                                        sort_action="native",
+                                        page_action="none"
+                                    )
+                                ]
+                            ),
+                        ]
+                    ),
+                    dcc.Tab(
+                        label="Compare Courses",
+                        children=[
+                            html.H2("Compare Two Courses"),
+                            html.P("Select two courses to compare."),
+                            #dropdown menus
+                            dcc.Dropdown(
+                                id='course-one-dropdown',
+                                options=race_options,
+                                placeholder="Select the first course",
+                            ),
+                            dcc.Dropdown(
+                                id='course-two-dropdown',
+                                options=race_options,
+                                placeholder="Select the second course",
+                            ),
+                            html.Button("Compare Courses", id='compare-button', n_clicks=0),
+                            html.Div(id='comparison-result', style={'marginTop':'20px'}),
+                        
+                            html.H2("Compare All Courses"),
+                            html.P("Select one course as a point of comparison. Courses must have a minimum of 15 runners in common to be comparable."),
+                            dcc.Dropdown(
+                                id="full-course-dropdown",
+                                options=race_options,
+                                placeholder="Select a course",
+                            ),
+                            html.Button("Compare", id="full-compare-button"),
+                            html.P("To estimate a runner's time in a different race, multiply their time for the primary race by the ratio. Their time combines how many seconds you'd have to add or subtract to the average person's time in the primary race to estimate their time in the secondary race. If no ratios or times besides 0 and 1 are shown in the table, there were not enough runners in common between the races. The standard error shows how much the ratio could change with a different group of shared runners; a ratio is roughly accurate to within two standard errors."),
+                            html.Div(id="output-2"),
+                        ]
+                    ),
+                    dcc.Tab(
+                        label="Predict Times",
+                        children=[
+                            html.H2("Predict Runner Times on a Course"),
+                            html.P("Select a course to predict."),
+                            dcc.Dropdown(
+                                id='course-dropdown',
+                                options=race_options,
+                                placeholder="Select race",
+                            ),
+                            html.Button("Predict Times", id='predict-button', n_clicks=0),
+                            html.Div(id='prediction-result', style={'marginTop':'20px'}),
+                        ]
+                    ),
+                    dcc.Tab(
+                        label="Virtual Meets",
+                        children=[
+                            html.H2("Run a Virtual Meet"),
+                            html.P("Select teams"),
+                        dcc.Dropdown(
+                            id='teams-dropdown',
+                            options=[],
+                            placeholder="Start typing to select teams",
+                            multi=True,
+                        ),
+                        dcc.Dropdown(
+                            id="primary-course-dropdown",
+                            options=race_options,
+                            placeholder="Select primary course",
+                        ),
+                        html.Button("Run Meet", id="meet-button", n_clicks=0),
+                        html.Div(id="meet-result", style={'marginTop':'20px'}),
+                        ]
+                    ),
+                ]
+            )
+        ]
+    )
+
+app.layout = serve_layout
+
+#callback for TFRRS URL
+#a scrape only sends the new race's rows (appended with Patch) and the refreshed race dropdowns
+@app.callback(
+    [Output("race-table", "data")] + [Output(dropdown, "options") for dropdown in race_dropdowns],
+    [Input("scrape-button", "n_clicks"),
+     Input("clear-table-button", "n_clicks")],
+    [State("gender-dropdown", "value"),
+     State("url-input", "value")],
+    prevent_initial_call=True
+)
+def load_or_scrape_data(scrape_clicks, clear_clicks, gender, url):
+    no_change = [dash.no_update] * (1 + len(race_dropdowns))
+    if not dash.callback_context.triggered:
+        return no_change
+    
+    triggered_id = dash.callback_context.triggered[0]["prop_id"].split(".")[0]
+    
+    if triggered_id == "clear-table-button":
+        try:
+            #rebuilt on a staged copy and swapped in at once, so queries in flight never see missing tables
+            with writer.staged() as stage:
+                stage.drop_all_tables(are_you_sure=True)
+                stage.build_tables()
+            return [[]] + [current_race_options()] * len(race_dropdowns)
+        except Exception as e:
+            print(f"Error clearing table: {e}")
+            return no_change
+        
+    if triggered_id == "scrape-button":
+        if not url:
+            return no_change
+        try:
+            #each race is stored in one transaction under writer's write lock, so readers see all of it or none
+            if gender == 'both':
+                race_ids = writer.load_meet(url) #one download for both genders
+            else:
+                race_ids = {gender: writer.load_results(url, gender)}
+            if all(race_id is None for race_id in race_ids.values()):
+                return no_change
+            new_rows = db.run_query(race_rows_query, {'women_race_id': race_ids.get('women'), 'men_race_id': race_ids.get('men')})
+            table_patch = Patch()
+            table_patch.extend(new_rows.to_dict("records"))
+            return [table_patch] + [current_race_options()] * len(race_dropdowns)
+        except Exception as e:
+            print(f"Error scraping data: {e}")
+        return no_change
+    
+    return no_change 
+    
+#every result as a CSV file, streamed from the database in chunks (db.iter_query) rather than built in memory
+@server.route("/download/results.csv")
+def download_results():
+    def generate():
+        for i, chunk in enumerate(db.iter_query(query)):
+            yield chunk.to_csv(header=(i == 0), index=False)
+    return Response(generate(), mimetype="text/csv",
+                    headers={"Content-Disposition": "attachment; filename=race_results.csv"})
+
+#read-only JSON API for other tools, e.g. /api/compare?one=1&two=2, /api/conversions?race_id=1, /api/predict?race_id=1
+#and /api/meet?schools=Elon&schools=Davidson&primary=1 (a virtual meet). The data version is the ETag, so a client
+#polling with If-None-Match gets an empty 304 until new races are loaded, and each worker keeps its recent responses in memory
+def int_param(args, name, default=None):
+    #one whole number from the query string; a ValueError if it's missing (without a default) or not a number
+    if name not in args:
+        if default is None:
+            raise ValueError('missing ' + name)
+        return default
+    return int(args[name][0])
+
+def meet_params(args):
+    if not args.get('schools'):
+        raise ValueError('missing schools')
+    return tuple(args['schools']), int_param(args, 'primary', 1)
+
+#each endpoint reads its parameters from the query string, then calls the cached analysis function with them
+api_endpoints = {
+    'compare': (lambda args: (int_param(args, 'one'), int_param(args, 'two')), cached_compare_two_courses),
+    'conversions': (lambda args: (int_param(args, 'race_id'),), cached_conversions),
+    'predict': (lambda args: (int_param(args, 'race_id'),), cached_predict_times),
+    'meet': (meet_params, cached_virtual_race),
+}
+
+@functools.lru_cache(maxsize=256)
+def api_body(endpoint, params, data_version):
+    if endpoint == 'meet' and not any(option['value'] == params[1] for option in current_race_options()):
+        return 404, json.dumps({'error': 'race not found'})
+    try:
+        results = api_endpoints[endpoint][1](*params, data_version)
+    except IndexError: #predict_times on a race nobody else ran
+        results = None
+    if results is None or (endpoint == 'compare' and results['NumCompared'].iloc[0] == 0):
+        return 404, json.dumps({'error': 'not enough data'})
+    return 200, results.to_json(orient='records')
+
+def api_error(status, message):
+    return Response(json.dumps({'error': message}), status=status, mimetype="application/json")
+
+@server.route("/api/<endpoint>")
+def api(endpoint):
+    if endpoint not in api_endpoints:
+        return api_error(404, 'unknown endpoint')
+    try:
+        params = api_endpoints[endpoint][0](request.args.to_dict(flat=False))
+    except ValueError:
+        return api_error(400, 'missing or invalid parameters')
+    version = db.data_version()
+    etag = str(version)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        status, body = api_body(endpoint, params, version)
+        response = Response(body, status=status, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache' #clients may keep responses but must check the ETag first
+    return response
+
+#callback for course comparisons
+@app.callback(
+    Output('comparison-result', 'children',),
+    Input('compare-button', 'n_clicks'),
+    State('course-one-dropdown', 'value'),
+    State('course-two-dropdown', 'value')
+)
+
+def compare_course(n_clicks, course_one, course_two):   
+    if not n_clicks or course_one is None or course_two is None:
+        return ""
+    results = cached_compare_two_courses(course_one, course_two, db.data_version())
+    
+    if results.empty:
+        return ""
+    difference = results['Difference'].iloc[0]
+    ratio = results['Ratio'].iloc[0]
+    
+    if pd.isna(difference) or pd.isna(ratio):
+        return 'No data available for comparison.'
+
+    return html.Div([
+        html.P(f"Difference in Average Times: {difference:.2f} seconds"),
+        html.P(f"Ratio of Average Times: {ratio:.2f} (standard error {results['RatioSE'].iloc[0]:.3f})"),
+        html.P(f"Runners in Common: {results['NumCompared'].iloc[0]}")
+    ])
+
+#callback for full course comparison (conversions function)
+@app.callback(
+    Output("output-2", "children"),
+    Input("full-compare-button", "n_clicks"),
+    State("full-course-dropdown", "value")
+)
+
+def conversions_callback(n_clicks, primary_race_id, min_comparisons=15):
+    if not n_clicks or primary_race_id is None:
+        return ""
+    
+    try: 
+        courses_df = cached_conversions(primary_race_id, db.data_version())
+        return html.Div([
+            html.H3(""),
+            dash_table.DataTable(
+                data=courses_df.to_dict("records"),
+                columns=[
+                    {"name":"Race ID", "id": "race_id"},
+                    {"name":"Race", "id":"race"},
+                    {"name":"Date", "id":"date"},
+                    {"name":"Ratio", "id":"ratio_conversion"},
+                    {"name":"Ratio Std. Error", "id":"ratio_se"},
+                    {"name":"Time", "id":"time_conversion"}
+                ],
+                filter_action="native",
+                sort_action="native",
+            )
+        ])
+    except Exception as e:
+        print(f"Error: {e}")
+        return f"Error: {str(e)}"
+        
+                    
+#callback for predicting times
+@app.callback(
+    Output('prediction-result', 'children'),
+    Input('predict-button', 'n_clicks'),
+    State('course-dropdown', 'value')
+)
+
+def predict_times_callback(n_clicks, target_course_id):    
+    if not n_clicks or target_course_id is None:
+        return "Click 'Predict Times' after selecting a course."
+    try:
+        predictions_df = cached_predict_times(target_course_id, db.data_version())
+        return html.Div([
+            html.H3(""),
+            html.P("Filter for a specific runner or team by typing underneath the column name."),
+            dash_table.DataTable(
+                data=predictions_df.to_dict('records'),
+                columns=[
+                    {'name': 'Runner ID', 'id': 'runner_id'},
+                    {'name': 'Name', 'id': 'name'},
+                    {'name': 'School', 'id': 'school'},
+                    {'name': 'Predicted Time', 'id': 'formatted_time'}
+                ],
+                filter_action="native",
+                sort_action="native",
+            )
+        ])
+    except Exception as e:
+        print(f"Error: {e}")
+        return f"Error: {str(e)}"
+    
+#callback for server-side team search in the virtual meet dropdown
+@app.callback(
+    Output("teams-dropdown", "options"),
+    Input("teams-dropdown", "search_value"),
+    State("teams-dropdown", "value"),
+)
+
+def teams_typeahead_callback(search_value, selected):
+    selected = selected or []
+    schools = db.school_lookup(search_value or '', limit=typeahead_limit)['school'].tolist()
+    # keep already selected teams in the options so the dropdown can still display them
+    return [{'label':school, 'value':school} for school in selected + [s for s in schools if s not in selected]]
+
+#callback for virtual meets
+@app.callback(
+    Output("meet-result", "children"),
+    Input("meet-button", "n_clicks"),
+    State("teams-dropdown", "value"),
+    State("primary-course-dropdown", "value"),
+)
+
+def virtual_meets_callback(n_clicks, schools, primary):
+    if not n_clicks or schools is None:
+        return "Click 'Run Meet' after selecting teams."
+    try: 
+        results_df = cached_virtual_race(tuple(schools), primary, db.data_version())
+        
+        return dash_table.DataTable(
+            data=results_df.to_dict("records"),
+            columns=[
+                {"name": "Runner ID", "id":"runner_id"},
+                {"name": "Name", "id": "name"},
+                {"name": "Schools", "id": "school"},
+                {"name": "Estimated Time", "id": "estimated_time"},
+            ],
+            filter_action="native",
+            sort_action="native",
+        )         
+    except Exception as e:
+        print(f"Error: {e}")
+        return f"Error: {str(e)}"
+        
+                      
+def run_production(host, port, workers):
+    '''
+    Serves the app with gunicorn and several worker processes instead of the single-process debug server
+    '''
+    from gunicorn.app.base import BaseApplication
+
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{host}:{port}")
+            self.cfg.set('workers', workers)
+
+        def load(self):
+            return server
+
+    writer.use_wal() #lets the workers keep reading while a scrape is writing
+    ProductionServer().run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the course comparisons dashboard.')
+    parser.add_argument('--production', action='store_true', help='serve with gunicorn worker processes instead of the debug server')
+    parser.add_argument('--workers', type=int, default=4, help='number of worker processes in production mode')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    args = parser.parse_args()
+
+    #the version number alone doesn't identify the database: a different courses.db swapped in while the dashboard was
+    #stopped can have the same one, so start from an empty cache. Done here, once before any workers start, rather
+    #than on import, where every worker gunicorn boots or respawns would wipe what the others have cached
+    with server.app_context():
+        cache.clear()
+
+    if args.production:
+        run_production(args.host, args.port, args.workers)
+    else:
+        app.run_server(debug=True, host=args.host, port=args.port)
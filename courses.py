@@ -1,36 +1,431 @@
 import sqlite3
-import pandas as pd
+import argparse
+import functools
+import importlib.util
+import inspect
+import io
 import os
-import numpy as np
-from glob import glob
-import shutil
-from bs4 import BeautifulSoup
-import requests
+import re
+import sys
+import threading
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+def lazy_import(name):
+    '''
+    Returns module name without running it yet. The import happens the first time one of its
+    attributes is used, so importing courses doesn't pay for pandas, numpy or the scraping libraries
+    until a function actually needs them.
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError('No module named ' + repr(name), name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+bs4 = lazy_import('bs4') # only used for scraping
+requests = lazy_import('requests') # only used for scraping
+try:
+    import fcntl
+except ImportError: # not available on Windows, where writes are only serialized within one process
+    fcntl = None
+
+# fallback for write_lock when fcntl file locks aren't available
+write_thread_lock = threading.Lock()
+
+# tables that move to a season's own file when it's frozen (see CoursesDB.freeze_season)
+season_tables = ['tRace', 'tRaceResult', 'tTeamResult', 'tRaceSearch']
+
+def season_scoped(method):
+    '''
+    For CoursesDB methods that take season, start_date and end_date: while the method runs, only the frozen
+    season files those limits can reach are attached to its connections (see CoursesDB.season_scope).
+    '''
+    signature = inspect.signature(method)
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        with self.season_scope(bound.arguments['season'], bound.arguments['start_date'], bound.arguments['end_date']):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def writes(method):
+    '''
+    For CoursesDB methods that write to the database: the method runs holding write_lock.
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.write_lock():
+            return method(self, *args, **kwargs)
+    return wrapper
 
 class CoursesDB:
-    def __init__(self, path_db, create=False):
+    def __init__(self, path_db, create=False, read_only=False):
+        '''
+        Opens the database at path_db. With read_only=True every thread keeps one read-only
+        connection open and reuses it for all of its queries instead of opening a new one each time.
+        This is what the dashboard's query callbacks use when it runs with several workers.
+        '''
+        self.read_only = read_only
+        self.local = threading.local() # connections are never shared between threads
         self.db_exists(path_db, create)
+        if not read_only:
+            self.upgrade_tables()
         return
 
+
+    @property
+    def conn(self):
+        return self.local.conn
+
+    @conn.setter
+    def conn(self, value):
+        self.local.conn = value
+
+    @property
+    def curs(self):
+        return self.local.curs
+
+    @curs.setter
+    def curs(self, value):
+        self.local.curs = value
+
     
-    def connect(self):
+    def connect(self, attach=True):
+        # attach=False opens only the active file, without the frozen seasons (see attach_seasons)
+        if self.read_only:
+            # reuse this thread's connection, unless it was inherited from a parent process by a forked worker
+            if getattr(self.local, 'pid', None) != os.getpid():
+                # query_only rather than a mode=ro URI, since a mode=ro connection can't open a WAL database
+                # unless another connection already has it open
+                self.conn = sqlite3.connect(self.path_db)
+                self.curs = self.conn.cursor()
+                self.curs.execute("PRAGMA query_only = ON;")
+                self.local.pid = os.getpid()
+                self.local.attached = None
+            self.attach_seasons()
+            return
         self.conn = sqlite3.connect(self.path_db)
         self.curs = self.conn.cursor()
         self.curs.execute("PRAGMA foreign_keys = ON;")
+        self.local.attached = None
+        if attach:
+            self.attach_seasons()
         return
 
     
     def close(self):
+        if self.read_only: # shared connections stay open
+            return
         self.conn.close()
         return
 
+
+    @contextmanager
+    def write_lock(self):
+        '''
+        Serializes writes to the database across threads and worker processes, using a lock file next to it.
+        Every write has to hold it (store_results, upgrade_tables, drop_all_tables and build_tables take it themselves),
+        or staged() could copy its snapshot back over the write. A thread that already holds it can take it again.
+        Use as "with db.write_lock(): ..." to make several writes in a row without another writer in between.
+        '''
+        if getattr(self.local, 'lock_depth', 0) > 0:
+            self.local.lock_depth += 1
+            try:
+                yield
+            finally:
+                self.local.lock_depth -= 1
+            return
+        self.local.lock_depth = 1
+        try:
+            with self.file_lock():
+                yield
+        finally:
+            self.local.lock_depth = 0
+
+
+    @contextmanager
+    def file_lock(self):
+        # the lock file behind write_lock, which keeps track of taking it again in the same thread
+        if fcntl is None:
+            with write_thread_lock:
+                yield
+            return
+        with open(self.path_db + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+    def use_wal(self):
+        '''
+        Switches the database to write-ahead logging, so readers don't wait on a scrape that is writing.
+        The setting is stored in the database file and only needs to be run once.
+        '''
+        self.connect()
+        self.curs.execute("PRAGMA journal_mode = WAL;").fetchall()
+        self.close()
+        return
+
+
+    def snapshot(self, path_snapshot:str):
+        '''
+        Writes a consistent copy of the database to path_snapshot with SQLite's online backup API. The copy is taken
+        inside one read transaction, so a scrape that is writing at the same time is either all in it or not at all.
+        '''
+        self.connect()
+        target = sqlite3.connect(path_snapshot)
+        self.conn.backup(target)
+        target.close()
+        self.close()
+        return
+
+
+    @contextmanager
+    def staged(self):
+        '''
+        For bulk loads and rebuilds that readers shouldn't see half done. Yields a CoursesDB on a snapshot of the database
+        (path_db + '.staging'); make the changes through it, and when the block finishes without an error the snapshot is
+        copied back over the database in a single transaction with the backup API. Readers see the old data until then and
+        the new data after, never a mix, and aren't held up while the load runs. Holds write_lock the whole time, so
+        writes that take it (see write_lock) wait instead of being copied over. It copies the whole database twice,
+        so it is meant for rebuilds like clearing the tables rather than loading one race.
+        Readers can only keep reading during the copy back in write-ahead logging mode, so it switches the database to it
+        (see use_wal). The snapshot and its lock file are removed afterwards.
+        Use as "with db.staged() as stage: stage.drop_all_tables(are_you_sure=True); stage.build_tables()".
+        '''
+        path_staging = self.path_db + '.staging'
+        with self.write_lock():
+            self.use_wal()
+            if os.path.exists(path_staging):
+                os.remove(path_staging) # left over from a run that crashed
+            self.snapshot(path_staging)
+            try:
+                stage = CoursesDB(path_staging)
+                yield stage
+                stage.connect()
+                self.connect()
+                stage.conn.backup(self.conn)
+                self.close()
+                stage.close()
+            finally:
+                os.remove(path_staging)
+                if os.path.exists(path_staging + '.lock'): # from writes made through stage
+                    os.remove(path_staging + '.lock')
+
+
+    def season_files(self, curs=None):
+        '''
+        Returns the frozen seasons as a dictionary of season: path to its file (see freeze_season).
+        Reads through curs, or this thread's open connection.
+        '''
+        curs = self.curs if curs is None else curs
+        try:
+            rows = curs.execute("SELECT season, path FROM main.tSeasonShard;").fetchall()
+        except sqlite3.OperationalError: # tables not built yet
+            return {}
+        folder = os.path.dirname(os.path.abspath(self.path_db))
+        return {season: os.path.join(folder, path) for season, path in rows}
+
+
+    @contextmanager
+    def season_scope(self, season=None, start_date=None, end_date=None):
+        '''
+        Limits the frozen season files that this thread's queries attach to the ones a season and/or date range
+        (as in scope_filter) can reach. The active file is always read. Scopes nest, and the previous one is
+        restored at the end of the block. Methods that take these limits apply them with the season_scoped decorator.
+        '''
+        previous = getattr(self.local, 'scope', None)
+        self.local.scope = (season, start_date, end_date)
+        try:
+            yield
+        finally:
+            self.local.scope = previous
+
+
+    def attach_seasons(self, conn=None):
+        '''
+        Attaches the frozen season files that the current season_scope can reach (all of them outside a scope) as
+        season_<year>, and puts TEMP views in front of the race tables that UNION ALL the active file with them,
+        so queries written against tRace, tRaceResult, tTeamResult and tRaceSearch see every attached season.
+        With no season files in scope nothing is attached and queries only read the active file.
+        Writes to those tables have to name main explicitly. Works on this thread's open connection,
+        or on conn for a connection of its own (like iter_query's).
+        '''
+        curs = self.curs if conn is None else conn.cursor()
+        files = self.season_files(curs)
+        season, start_date, end_date = getattr(self.local, 'scope', None) or (None, None, None)
+        low = high = int(season) if season is not None else None
+        if start_date is not None:
+            start_season = self.season_of(str(start_date)[0:10])
+            low = start_season if low is None else max(low, start_season)
+        if end_date is not None:
+            end_season = self.season_of(str(end_date)[0:10])
+            high = end_season if high is None else min(high, end_season)
+        wanted = tuple((year, files[year]) for year in sorted(files)
+                       if (low is None or year >= low) and (high is None or year <= high))
+        if conn is None and wanted == getattr(self.local, 'attached', None):
+            return
+
+        query_only = curs.execute("PRAGMA query_only;").fetchall()[0][0]
+        curs.execute("PRAGMA query_only = OFF;") # TEMP views count as writes
+        for table in season_tables:
+            curs.execute("DROP VIEW IF EXISTS temp." + table + ";")
+        for _, name, _ in curs.execute("PRAGMA database_list;").fetchall():
+            if name.startswith('season_'):
+                curs.execute("DETACH DATABASE " + name + ";")
+        if wanted:
+            for year, path in wanted:
+                curs.execute("ATTACH DATABASE ? AS season_" + str(year) + ";", (path,))
+            for table in season_tables:
+                columns = 'rowid, race' if table == 'tRaceSearch' else '*'
+                sources = ['main'] + ['season_' + str(year) for year, _ in wanted]
+                curs.execute("CREATE TEMP VIEW " + table + " AS "
+                                  + " UNION ALL ".join("SELECT " + columns + " FROM " + source + "." + table for source in sources) + ";")
+        curs.execute("PRAGMA query_only = " + str(query_only) + ";")
+        if conn is None:
+            self.local.attached = wanted
+        return
+
+
+    def freeze_season(self, season:int):
+        '''
+        Moves the races, results and team results of season (a finished one) out of the active database into a file of
+        their own next to it (courses_2023.db for courses.db), which is compacted and indexed once. Runners stay in
+        the active file. Afterwards queries attach the season's file when they need it (see attach_seasons), so queries
+        limited to the current season only read the small active file. Returns the path of the new file.
+        '''
+        season = int(season)
+        name = os.path.splitext(os.path.basename(self.path_db))[0] + '_' + str(season) + '.db'
+        path_season = os.path.join(os.path.dirname(os.path.abspath(self.path_db)), name)
+        with self.write_lock():
+            self.connect(attach=False)
+            if season in self.season_files():
+                self.close()
+                raise ValueError('Season ' + str(season) + ' is already frozen.')
+            if self.curs.execute("SELECT COUNT(*) FROM main.tRace WHERE season = ?;", (season,)).fetchall()[0][0] == 0:
+                self.close()
+                raise ValueError('No races from season ' + str(season) + ' are loaded.')
+            if os.path.exists(path_season):
+                os.remove(path_season)
+
+            # same tables, indexes and search triggers as the active file
+            sql = '''
+            SELECT sql FROM main.sqlite_master
+            WHERE tbl_name IN (''' + ', '.join(['?']*len(season_tables)) + ''') AND sql IS NOT NULL
+            ORDER BY type = 'table' DESC, type = 'index' DESC, rowid
+            ;'''
+            schema = [row[0] for row in self.curs.execute(sql, season_tables).fetchall()]
+            season_conn = sqlite3.connect(path_season)
+            for statement in schema:
+                season_conn.execute(statement)
+            season_conn.commit()
+            season_conn.close()
+
+            # the season's file has no tRunner, so its rows can't be checked against it
+            self.curs.execute("PRAGMA foreign_keys = OFF;")
+            # tRunnerStats from before latest_race_id stopped being a foreign key would refuse races in the season's file
+            if 'REFERENCES tRace' in self.curs.execute("SELECT sql FROM main.sqlite_master WHERE name = 'tRunnerStats';").fetchall()[0][0]:
+                self.curs.execute("ALTER TABLE main.tRunnerStats RENAME TO tRunnerStatsOld;")
+                self.build_support_tables()
+                self.curs.execute("INSERT INTO main.tRunnerStats SELECT * FROM main.tRunnerStatsOld;")
+                self.curs.execute("DROP TABLE main.tRunnerStatsOld;")
+            self.curs.execute("ATTACH DATABASE ? AS frozen;", (path_season,))
+            self.curs.execute("INSERT INTO frozen.tRace SELECT * FROM main.tRace WHERE season = ?;", (season,))
+            for table in ['tRaceResult', 'tTeamResult']:
+                self.curs.execute("INSERT INTO frozen." + table + " SELECT * FROM main." + table
+                                  + " WHERE race_id IN (SELECT race_id FROM frozen.tRace);")
+                self.curs.execute("DELETE FROM main." + table + " WHERE race_id IN (SELECT race_id FROM frozen.tRace);")
+            self.curs.execute("DELETE FROM main.tRace WHERE season = ?;", (season,))
+            self.curs.execute("INSERT INTO main.tSeasonShard (season, path) VALUES (?, ?);", (season, name))
+            self.bump_data_version()
+            self.conn.commit()
+            self.curs.execute("DETACH DATABASE frozen;")
+            self.close()
+
+            season_conn = sqlite3.connect(path_season)
+            season_conn.execute("VACUUM;")
+            season_conn.execute("ANALYZE;")
+            season_conn.close()
+        return path_season
+
+
+    def data_version(self):
+        '''
+        Returns a number that goes up every time results are loaded or the tables are rebuilt.
+        Cached results tagged with an older number are out of date.
+        '''
+        self.connect()
+        version = self.curs.execute("PRAGMA user_version;").fetchall()[0][0]
+        self.close()
+        return version
+
+
+    def bump_data_version(self):
+        '''
+        Marks the data as changed (see data_version). Expects an open connection.
+        '''
+        version = self.curs.execute("PRAGMA user_version;").fetchall()[0][0]
+        self.curs.execute("PRAGMA user_version = " + str(int(version) + 1) + ";")
+        return
+
     
-    def run_query(self, sql, params=None, manage_conn = True):
+    def run_query(self, sql, params=None, manage_conn = True, compact = False):
+        '''
+        Runs sql and returns the results as a DataFrame. With compact=True the columns are shrunk with compact_dtypes.
+        '''
         self.connect()
         results = pd.read_sql(sql, self.conn, params = params)
         if manage_conn: self.close()
+        if compact: results = self.compact_dtypes(results)
         return results
 
+
+    def iter_query(self, sql, params=None, chunksize=10000, arrow=False):
+        '''
+        Runs sql and yields the results chunksize rows at a time as DataFrames (or pyarrow RecordBatches with arrow=True,
+        which needs pyarrow installed). SQLite steps through the results as they are read, so only one chunk is held
+        in memory at a time. The query gets its own connection, so other queries can run between chunks.
+        '''
+        conn = sqlite3.connect(self.path_db)
+        try:
+            if self.read_only:
+                conn.execute("PRAGMA query_only = ON;")
+            self.attach_seasons(conn)
+            for chunk in pd.read_sql(sql, conn, params = params, chunksize = chunksize):
+                yield lazy_import('pyarrow').RecordBatch.from_pandas(chunk, preserve_index=False) if arrow else chunk
+        finally:
+            conn.close()
+
+
+    def compact_dtypes(self, frame):
+        '''
+        Shrinks a DataFrame of query results to smaller dtypes: ID and place columns become int32, race times become
+        float32 (plenty for times recorded to a tenth of a second), and repeated text like names, schools and races
+        becomes categorical. Columns with missing values keep their original dtype.
+        '''
+        for col in frame.columns:
+            if col.endswith('_id') or col == 'place':
+                if frame[col].notna().all():
+                    frame[col] = frame[col].astype('int32')
+            elif col == 'time':
+                frame[col] = frame[col].astype('float32')
+            elif col in ('name', 'school', 'race', 'eligibility', 'date', 'raw_time'):
+                frame[col] = frame[col].astype('category')
+        return frame
+
        
         '''
         ------------------------------------------------- DATABASES & TABLES --------------------------------------------------------------
@@ -56,6 +451,7 @@ class CoursesDB:
         return
 
     
+    @writes
     def drop_all_tables(self, are_you_sure=False):
         '''
         Drop all tables from the database
@@ -63,10 +459,18 @@ class CoursesDB:
         self.connect()
         
         try:
-            self.curs.execute("DROP TABLE IF EXISTS tRaceResult;")
-            self.curs.execute("DROP TABLE IF EXISTS tRace;")
+            self.curs.execute("DROP TABLE IF EXISTS main.tRaceResult;")
+            self.curs.execute("DROP TABLE IF EXISTS main.tTeamResult;")
+            self.curs.execute("DROP TABLE IF EXISTS tRunnerStats;")
+            self.curs.execute("DROP TABLE IF EXISTS tPrecomputed;")
+            self.curs.execute("DROP TABLE IF EXISTS main.tRace;")
+            self.curs.execute("DROP TABLE IF EXISTS tSeasonShard;") # the season files are left on disk
+            self.curs.execute("DROP TABLE IF EXISTS tRunnerGram;")
+            self.curs.execute("DROP TABLE IF EXISTS tRunnerSearch;")
+            self.curs.execute("DROP TABLE IF EXISTS main.tRaceSearch;")
             self.curs.execute("DROP TABLE IF EXISTS tRunner;")
             self.curs.execute("DROP TABLE IF EXISTS tTeam;")
+            self.bump_data_version()
         except Exception as e:
             self.close()
             raise e
@@ -74,6 +478,7 @@ class CoursesDB:
         return
 
 
+    @writes
     def build_tables(self):
         '''
         Build all tables in the database,
@@ -86,7 +491,10 @@ class CoursesDB:
             runner_id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
             eligibility TEXT NOT NULL,
-            school TEXT NOT NULL 
+            school TEXT NOT NULL,
+            name_key TEXT,
+            school_key TEXT,
+            gender TEXT -- from the races they ran, NULL while that isn't known
         )
         ;"""
         self.curs.execute(sql) 
@@ -108,27 +516,197 @@ class CoursesDB:
         CREATE TABLE tRace (
             race_id INTEGER PRIMARY KEY,
             race TEXT NOT NULL,
-            date TEXT NOT NULL
+            date TEXT NOT NULL,
+            gender TEXT,
+            race_date TEXT, -- date as YYYY-MM-DD, NULL if it couldn't be read
+            season INTEGER
             -- distance TEXT NOT NULL
         )
         ;"""
         self.curs.execute(sql)
+
+        sql = """
+        CREATE TABLE tTeamResult (
+            race_id INTEGER REFERENCES tRace(race_id),
+            school TEXT NOT NULL,
+            place INTEGER,
+            score INTEGER,
+            PRIMARY KEY(race_id, school)
+        )
+        ;"""
+        self.curs.execute(sql)
+
+        self.build_support_tables()
+        self.bump_data_version()
         
         self.close()
         return
 
 
+    def build_support_tables(self):
+        '''
+        Build the lookup tables and indexes that sit alongside the main tables.
+        Safe to run more than once. Expects an open connection.
+        '''
+        # per-runner aggregates, kept up to date by update_runner_stats as races are loaded
+        sql = """
+        CREATE TABLE IF NOT EXISTS tRunnerStats (
+            runner_id INTEGER PRIMARY KEY REFERENCES tRunner(runner_id),
+            num_races INTEGER NOT NULL,
+            mean_time FLOAT NOT NULL,
+            best_time FLOAT NOT NULL,
+            latest_race_id INTEGER, -- not a foreign key, since the race can be in a frozen season's file
+            latest_time FLOAT
+        )
+        ;"""
+        self.curs.execute(sql)
+
+        # analysis results written by precompute, stamped with the data version they were computed from
+        sql = """
+        CREATE TABLE IF NOT EXISTS tPrecomputed (
+            kind TEXT NOT NULL,
+            race_id INTEGER NOT NULL,
+            data_version INTEGER NOT NULL,
+            result TEXT NOT NULL, -- JSON records
+            PRIMARY KEY(kind, race_id)
+        )
+        ;"""
+        self.curs.execute(sql)
+
+        # seasons moved to their own files by freeze_season
+        sql = """
+        CREATE TABLE IF NOT EXISTS tSeasonShard (
+            season INTEGER PRIMARY KEY,
+            path TEXT NOT NULL -- relative to the folder the database is in
+        )
+        ;"""
+        self.curs.execute(sql)
+
+        # name trigrams for each runner, blocked by school so a lookup only touches one roster
+        sql = """
+        CREATE TABLE IF NOT EXISTS tRunnerGram (
+            school_key TEXT NOT NULL,
+            gram TEXT NOT NULL,
+            runner_id INTEGER REFERENCES tRunner(runner_id),
+            PRIMARY KEY(school_key, gram, runner_id)
+        ) WITHOUT ROWID
+        ;"""
+        self.curs.execute(sql)
+        self.curs.execute("CREATE INDEX IF NOT EXISTS idx_tRunner_keys ON tRunner(school_key, name_key);")
+        self.curs.execute("CREATE INDEX IF NOT EXISTS idx_tRace_season ON tRace(season, race_date);")
+        # covering index for looking up a race's results, used by the course comparisons
+        self.curs.execute("CREATE INDEX IF NOT EXISTS idx_tRaceResult_race ON tRaceResult(race_id, runner_id, time);")
+
+        # trigram full text indexes for the lookup functions. They read their text from tRunner and tRace
+        # (external content), and the triggers below keep them in sync as rows are loaded
+        self.curs.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS tRunnerSearch
+        USING fts5(name, school, content='tRunner', content_rowid='runner_id', tokenize='trigram')
+        ;""")
+        self.curs.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS tRaceSearch
+        USING fts5(race, content='tRace', content_rowid='race_id', tokenize='trigram')
+        ;""")
+        self.curs.executescript("""
+        CREATE TRIGGER IF NOT EXISTS tRunner_search_insert AFTER INSERT ON tRunner BEGIN
+            INSERT INTO tRunnerSearch(rowid, name, school) VALUES (new.runner_id, new.name, new.school);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tRunner_search_delete AFTER DELETE ON tRunner BEGIN
+            INSERT INTO tRunnerSearch(tRunnerSearch, rowid, name, school) VALUES ('delete', old.runner_id, old.name, old.school);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tRunner_search_update AFTER UPDATE OF name, school ON tRunner BEGIN
+            INSERT INTO tRunnerSearch(tRunnerSearch, rowid, name, school) VALUES ('delete', old.runner_id, old.name, old.school);
+            INSERT INTO tRunnerSearch(rowid, name, school) VALUES (new.runner_id, new.name, new.school);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tRace_search_insert AFTER INSERT ON tRace BEGIN
+            INSERT INTO tRaceSearch(rowid, race) VALUES (new.race_id, new.race);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tRace_search_delete AFTER DELETE ON tRace BEGIN
+            INSERT INTO tRaceSearch(tRaceSearch, rowid, race) VALUES ('delete', old.race_id, old.race);
+        END;
+        CREATE TRIGGER IF NOT EXISTS tRace_search_update AFTER UPDATE OF race ON tRace BEGIN
+            INSERT INTO tRaceSearch(tRaceSearch, rowid, race) VALUES ('delete', old.race_id, old.race);
+            INSERT INTO tRaceSearch(rowid, race) VALUES (new.race_id, new.race);
+        END;
+        """)
+        return
+
+
+    @writes
+    def upgrade_tables(self):
+        '''
+        Bring a database built by an older version of build_tables up to date.
+        Missing columns, tables and indexes are added in place and existing data is kept.
+        Does nothing if the tables have not been built yet.
+        '''
+        self.connect(attach=False) # schema changes only apply to the active file
+        tables = [row[0] for row in self.curs.execute("SELECT name FROM sqlite_master WHERE type = 'table';").fetchall()]
+        if 'tRunner' not in tables:
+            self.close()
+            return
+
+        runner_columns = [row[1] for row in self.curs.execute("PRAGMA table_info(tRunner);").fetchall()]
+        if 'name_key' not in runner_columns:
+            self.curs.execute("ALTER TABLE tRunner ADD COLUMN name_key TEXT;")
+        if 'school_key' not in runner_columns:
+            self.curs.execute("ALTER TABLE tRunner ADD COLUMN school_key TEXT;")
+        race_columns = [row[1] for row in self.curs.execute("PRAGMA table_info(tRace);").fetchall()]
+        if 'gender' not in race_columns: # races loaded before this are left with an unknown (NULL) gender
+            self.curs.execute("ALTER TABLE tRace ADD COLUMN gender TEXT;")
+        if 'race_date' not in race_columns:
+            self.curs.execute("ALTER TABLE tRace ADD COLUMN race_date TEXT;")
+            self.curs.execute("ALTER TABLE tRace ADD COLUMN season INTEGER;")
+            for race_id, date in self.curs.execute("SELECT race_id, date FROM tRace;").fetchall():
+                race_date = self.parse_race_date(date)
+                self.curs.execute("UPDATE tRace SET race_date = ?, season = ? WHERE race_id = ?;",
+                                  (race_date, self.season_of(race_date), race_id))
+        if 'tTeamResult' not in tables:
+            self.curs.execute('''
+            CREATE TABLE tTeamResult (
+                race_id INTEGER REFERENCES tRace(race_id),
+                school TEXT NOT NULL,
+                place INTEGER,
+                score INTEGER,
+                PRIMARY KEY(race_id, school)
+            )
+            ;''')
+        if 'gender' not in runner_columns: # from the races each runner has run, where their gender is known
+            self.curs.execute("ALTER TABLE tRunner ADD COLUMN gender TEXT;")
+            self.curs.execute('''
+            UPDATE tRunner SET gender = (SELECT MIN(tRace.gender) FROM tRaceResult JOIN tRace USING (race_id)
+                                         WHERE tRaceResult.runner_id = tRunner.runner_id)
+            ;''')
+        self.build_support_tables()
+
+        # the search indexes only see rows inserted after they exist, so fill them from the current tables
+        if 'tRunnerSearch' not in tables:
+            self.curs.execute("INSERT INTO tRunnerSearch(tRunnerSearch) VALUES ('rebuild');")
+        if 'tRaceSearch' not in tables:
+            self.curs.execute("INSERT INTO tRaceSearch(tRaceSearch) VALUES ('rebuild');")
+        if 'tRunnerStats' not in tables:
+            self.update_runner_stats()
+
+        # fill in the matching keys for any runners loaded before they existed
+        missing = self.curs.execute("SELECT runner_id, name, school FROM tRunner WHERE name_key IS NULL;").fetchall()
+        for runner_id, name, school in missing:
+            self.index_runner(runner_id, name, school)
+
+        self.conn.commit()
+        self.close()
+        return
+
+
         '''
         ------------------------------------------------- WEB SCRAPING --------------------------------------------------------------
         '''
 
-    def get_results(self, url:str, gender = 'women', drop_dnf=True, drop_dns=True):
+    def get_meet_results(self, url:str, drop_dnf=True, drop_dns=True):
         '''
-        A function that takes a race URL from TFRRS and returns scraped results
-        from that race. By default it returns women's results. Pass 'men' to 
-        the gender argument to get men's results. Runners who did not finish
-        (DNF) or did not start (DNS) are removed from scraped results. To     
-        keep them in the results, change drop_dnf and drop_dns to False.
+        A function that takes a race URL from TFRRS and scrapes every results table on the page from a single
+        download. Returns a dictionary with the men's and women's individual results under 'men' and 'women'
+        (in the same format as get_results, or None if the page has no results for that gender) and the team
+        results under 'teams', one row per team with the columns PL, TEAM, SCORE, GENDER, COURSE and DATE.
+        Runners who did not finish (DNF) or did not start (DNS) are removed unless drop_dnf or drop_dns is False.
         '''
         
         #get course name from url:
@@ -137,7 +715,7 @@ class CoursesDB:
         
         #initializing webscraper in html format:
         page = requests.get(url)
-        soup = BeautifulSoup(page.text, 'lxml') #, originally html
+        soup = bs4.BeautifulSoup(page.text, 'lxml') #, originally html
         
         #getting the date from the results:
         date_div = soup.find('div', class_ = 'panel-heading-normal-text inline-block')
@@ -146,32 +724,62 @@ class CoursesDB:
         #finding all of the results that exist on the page - men's and women's team, men's and women's individual:
         tables = soup.find_all('table')
         titles = soup.find_all('div', class_ = 'custom-table-title custom-table-title-xc')
-                               
-        #going through the titles of each table to skip team results and scrape men's or women's results depending on user input:
+
+        #going through the titles of each table and sorting them into men's, women's and team results:
+        results = {'men': None, 'women': None}
+        team_frames = []
         for i, title_div in enumerate(titles):
             title_text = title_div.find('h3', class_ = 'font-weight-500').text.strip()
-            
-            if "Team" in title_text:
-                continue
-                
-            if (gender == "women" and "Women" not in title_text) or \
-               (gender == "men" and "Men" not in title_text):
+            if "Women" in title_text:
+                gender = 'women'
+            elif "Men" in title_text:
+                gender = 'men'
+            else:
                 continue
-        
-            #getting the columns for the scraped data based on columns that are in the results:
-            table = tables[i]
-            world_titles = table.find_all('th')
-            world_table_titles = [title.text.strip() for title in world_titles]
-            
-        #initializing the data frame
-        df = pd.DataFrame(columns = world_table_titles + ['COURSE', 'DATE'])
+
+            if "Team" in title_text:
+                teams = self.parse_results_table(tables[i], course_name, date, ['PL', 'TEAM', 'SCORE', 'COURSE', 'DATE'])
+                teams['GENDER'] = gender
+                team_frames.append(teams)
+            else:
+                results[gender] = self.parse_results_table(tables[i], course_name, date, 
+                    ['PL', 'NAME', 'YEAR', 'TEAM', 'Avg. Mile', 'TIME', 'SCORE', 'COURSE', 'DATE'], drop_dnf, drop_dns)
+
+        #individual results get their times converted to seconds:
+        for gender, df in results.items():
+            if df is not None:
+                df['PL'] = df['PL'].astype(int)
+                results[gender] = self.time_to_seconds(df)
+
+        #team scores are blank for teams without enough finishers:
+        if team_frames:
+            teams = pd.concat(team_frames, ignore_index=True)
+            teams['PL'] = pd.to_numeric(teams['PL'], errors='coerce')
+            teams['SCORE'] = pd.to_numeric(teams['SCORE'], errors='coerce')
+        else:
+            teams = pd.DataFrame(columns = ['PL', 'TEAM', 'SCORE', 'COURSE', 'DATE', 'GENDER'])
+        results['teams'] = teams
+    
+        return results
+
+
+    def parse_results_table(self, table, course_name:str, date:str, desired_columns:list, drop_dnf=True, drop_dns=True):
+        '''
+        Turns one scraped results table into a data frame, keeping only desired_columns and adding the course name and date.
+        '''
+        #getting the columns for the scraped data based on columns that are in the results:
+        world_titles = table.find_all('th')
+        world_table_titles = [title.text.strip() for title in world_titles]
             
         #each individual result in each table starts with 'tr' - finding all of those and stripping them:
+        rows = []
         column_data = table.find_all('tr')
         for row in column_data[1:]:
             if hasattr(row, 'find_all'):
                 row_data = row.find_all('td')
                 individual_row_data = [data.text.strip() for data in row_data]
+                if len(individual_row_data) != len(world_table_titles): # skip rows that don't line up with the header
+                    continue
                 
                 #removing DNF/DNS (did not finish or did not start):
                 if drop_dnf and "DNF" in individual_row_data: #remove DNFs (can change to FALSE if want them in there)
@@ -179,89 +787,309 @@ class CoursesDB:
                 if drop_dns and "DNS" in individual_row_data: #same for DNS
                     continue
                 
-                individual_row_data.append(course_name)
-                individual_row_data.append(date)
-                
-                #making the length of the data frame the length of the row data from the results:
-                length = len(df)
-                df.loc[length] = individual_row_data
+                rows.append(individual_row_data + [course_name, date])
+
+        df = pd.DataFrame(rows, columns = world_table_titles + ['COURSE', 'DATE'])
             
         #removing any extra columns (like splits for each 1k or any extra info) from the results so all the dataframes are uniform:
-        desired_columns = ['PL', 'NAME', 'YEAR', 'TEAM', 'Avg. Mile', 'TIME', 'SCORE', 'COURSE', 'DATE']
         extra_columns = [col for col in df.columns if col not in desired_columns]
         if extra_columns:
             df = df.drop(columns=extra_columns)
-        
-        df['PL'] = df['PL'].astype(int)
-        df = self.time_to_seconds(df)
-    
+        return df
+
+
+    def get_results(self, url:str, gender = 'women', drop_dnf=True, drop_dns=True):
+        '''
+        A function that takes a race URL from TFRRS and returns scraped results
+        from that race. By default it returns women's results. Pass 'men' to 
+        the gender argument to get men's results. Runners who did not finish
+        (DNF) or did not start (DNS) are removed from scraped results. To     
+        keep them in the results, change drop_dnf and drop_dns to False.
+        To get both genders and the team results from one download, use get_meet_results.
+        '''
+        df = self.get_meet_results(url, drop_dnf, drop_dns)[gender]
+        if df is None:
+            raise ValueError('No ' + gender + "'s individual results found at " + url)
         return df
 
     def time_to_seconds(self, frame):
         frame['CONVERTED'] = frame['TIME'].apply(lambda x: int(x[0:2])*60 + float(x[3:7]) if len(x) == 7 else x)
         return frame
+
+
+    def parse_race_date(self, text:str):
+        '''
+        Reads a scraped TFRRS date like "October  4, 2024", "Oct 18-19, 2024", "Sep 30 - Oct 1, 2024" or "Sep. 1, 2024" and
+        returns it as a YYYY-MM-DD string (the first day for multi-day meets). Returns None if the date can't be read, e.g. "Unknown Date".
+        '''
+        match = re.search(r'([A-Za-z]+)\.?\s+(\d{1,2})(?:\s*-\s*(?:[A-Za-z]+\.?\s+)?\d{1,2})?,\s*(\d{4})', str(text))
+        if match is None:
+            return None
+        month, day, year = match.groups()
+        for month_text, month_format in ((month, '%B'), (month[0:3], '%b')): # full month name, then abbreviated (Sept -> Sep)
+            try:
+                return datetime.strptime(month_text + ' ' + day + ' ' + year, month_format + ' %d %Y').strftime('%Y-%m-%d')
+            except ValueError:
+                pass
+        return None
+
+
+    def season_of(self, race_date):
+        '''
+        The season a YYYY-MM-DD race date belongs to. Cross country runs in the fall, so the season is the year.
+        '''
+        return int(race_date[0:4]) if race_date else None
+
+
+    def scope_filter(self, season=None, start_date=None, end_date=None):
+        '''
+        Builds a SQL condition on tRace and its parameters that limits a query to one season and/or to
+        races between start_date and end_date (inclusive, as 'YYYY-MM-DD' strings or dates). With no limits
+        the condition matches every race. Races whose date couldn't be read only match when there are no limits.
+        '''
+        conditions = ['1 = 1']
+        params = []
+        if season is not None:
+            conditions.append('tRace.season = ?')
+            params.append(int(season))
+        if start_date is not None:
+            conditions.append('tRace.race_date >= ?')
+            params.append(str(start_date)[0:10])
+        if end_date is not None:
+            conditions.append('tRace.race_date <= ?')
+            params.append(str(end_date)[0:10])
+        return ' AND '.join(conditions), params
         
 
         '''
         ------------------------------------------------- DYNAMIC DATA --------------------------------------------------------------
         '''
 
-    def get_runner_id(self, name:str, eligibility:str, school:str):
+    def match_key(self, text:str, sort_words=False):
+        '''
+        Normalizes a name or school for matching: accents and punctuation are removed,
+        letters are lowercased, '&' becomes 'and' and runs of spaces are collapsed. With sort_words=True the
+        words are also put in alphabetical order so "Smith, Jane" and "Jane Smith" match.
+        '''
+        text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode()
+        text = text.lower().replace('&', ' and ')
+        words = re.sub(r'[^a-z0-9]+', ' ', text).split()
+        if sort_words:
+            words = sorted(words)
+        return ' '.join(words)
+
+
+    def name_grams(self, name_key:str):
+        '''
+        Returns the set of 3-letter chunks (trigrams) of a normalized name, padded with spaces
+        so the start and end of each word count
+        '''
+        padded = ' ' + name_key + ' '
+        return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+
+    def index_runner(self, runner_id:int, name:str, school:str):
+        '''
+        Stores the matching keys and name trigrams for a runner. Expects an open connection.
+        '''
+        name_key = self.match_key(name, sort_words=True)
+        school_key = self.match_key(school)
+        self.curs.execute("UPDATE tRunner SET name_key = ?, school_key = ? WHERE runner_id = ?;",
+                          (name_key, school_key, int(runner_id)))
+        self.curs.executemany("INSERT OR IGNORE INTO tRunnerGram (school_key, gram, runner_id) VALUES (?, ?, ?);",
+                              [(school_key, gram, int(runner_id)) for gram in self.name_grams(name_key)])
+        return
+
+
+    def match_runner(self, name:str, school:str, race_id=None, gender=None, min_similarity=0.8):
+        '''
+        Looks for a runner already in the database who is probably the same person as name/school,
+        for example the same runner listed with a new class year the following season.
+        Only runners from the same school are considered, and only those sharing name trigrams with
+        the new name, so the cost depends on the size of one roster rather than the whole table.
+        A candidate matches if the trigram overlap (Jaccard similarity) is at least min_similarity.
+        Runners who already have a result in race_id are skipped, since one person can't place twice, and so are
+        runners of the other gender (runners whose gender isn't known yet can match either).
+        Returns the matching runner_id, or None. Expects an open connection.
+        '''
+        name_key = self.match_key(name, sort_words=True)
+        school_key = self.match_key(school)
+        grams = self.name_grams(name_key)
+        # unattached runners don't share a real roster, so only an identical name counts there
+        if school_key in ('', 'unattached'):
+            min_similarity = 1.0
+
+        sql = '''
+        SELECT tRunnerGram.runner_id, tRunner.name_key, COUNT(*) AS shared
+        FROM tRunnerGram
+        JOIN tRunner USING (runner_id)
+        WHERE tRunnerGram.school_key = ? AND tRunnerGram.gram IN (''' + ', '.join(['?']*len(grams)) + ''')
+            AND tRunnerGram.runner_id NOT IN (SELECT runner_id FROM tRaceResult WHERE race_id = ?)
+            AND (? IS NULL OR tRunner.gender IS NULL OR tRunner.gender = ?)
+        GROUP BY tRunnerGram.runner_id
+        ;'''
+        race_param = int(race_id) if race_id is not None else None
+        candidates = self.curs.execute(sql, (school_key, *grams, race_param, gender, gender)).fetchall()
+
+        best_id = None
+        best_similarity = 0
+        for runner_id, candidate_key, shared in candidates:
+            similarity = shared / (len(grams) + len(self.name_grams(candidate_key)) - shared)
+            if similarity >= min_similarity and similarity > best_similarity:
+                best_id, best_similarity = runner_id, similarity
+        return best_id
+
+
+    def get_runner_id(self, name:str, eligibility:str, school:str, race_id=None, gender=None):
         '''
         check if runner_id exists for this combo
+        if not, check for the same runner under a different class year or a slightly
+        different spelling (see match_runner) and reuse their runner_id
         add runner_id if not
+        gender is the gender of the race; runners of the other gender are never reused
         '''
         
-        sql_check = "SELECT runner_id FROM tRunner WHERE name LIKE ? AND eligibility LIKE ? AND school LIKE ?;"
-        x = pd.read_sql(sql_check, self.conn, params = (name, eligibility, school))
+        # compared on the matching keys, so the lookup uses the (school_key, name_key) index instead of scanning tRunner
+        sql_check = '''
+        SELECT runner_id FROM tRunner
+        WHERE school_key = ? AND name_key = ? AND eligibility = ? AND (? IS NULL OR gender IS NULL OR gender = ?)
+        ORDER BY gender IS NULL
+        ;'''
+        x = self.curs.execute(sql_check, (self.match_key(school), self.match_key(name, sort_words=True), eligibility, gender, gender)).fetchall()
+        runner_id = x[0][0] if len(x) > 0 else None
+
+        # link to a runner from an earlier season if there is one
+        if runner_id is None:
+            runner_id = self.match_runner(name, school, race_id, gender)
+        if runner_id is not None:
+            if gender is not None: # the first race with a known gender settles it
+                self.curs.execute("UPDATE tRunner SET gender = ? WHERE runner_id = ? AND gender IS NULL;", (gender, int(runner_id)))
+            return runner_id
         
         # if not, create it (run an INSERT)
-        if len(x) == 0:
-            sqlite3.register_adapter(np.int64, lambda val: int(val))
-            sql_insert = "INSERT INTO tRunner (name, eligibility, school) VALUES (?, ?, ?);" 
-            self.curs.execute(sql_insert, (name, eligibility, school))
-        x = pd.read_sql(sql_check, self.conn, params = (name, eligibility, school))
-        # return it   
-        runner_id = x.iloc[0,0]
+        sqlite3.register_adapter(np.int64, lambda val: int(val))
+        sql_insert = "INSERT INTO tRunner (name, eligibility, school, gender) VALUES (?, ?, ?, ?);" 
+        self.curs.execute(sql_insert, (name, eligibility, school, gender))
+        runner_id = self.curs.lastrowid
+        self.index_runner(runner_id, name, school)
         return runner_id
     
-    def get_race_id(self, race:str, date): 
+    def get_race_id(self, race:str, date, gender=None): 
         '''
         check if race_id exists for this combo
         create race_id and add race to tRace if not
+        the men's and women's races at a meet are separate races
         !ARIS
         '''
-        sql_check = "SELECT race_id FROM tRace WHERE race LIKE ? AND date LIKE ?;" # AND distance LIKE ?;"
-        x = pd.read_sql(sql_check, self.conn, params = (race, date)) #, distance))
+        # tRace is the view over the frozen season files too, so a race from a frozen season is found rather than added again.
+        # a race loaded before races had a gender (NULL) is the same race, and takes the gender now that it is known
+        sql_check = '''
+        SELECT race_id FROM tRace
+        WHERE race LIKE ? AND date LIKE ? AND (gender IS ? OR gender IS NULL)
+        ORDER BY gender IS NULL
+        ;''' # AND distance LIKE ?
+        x = pd.read_sql(sql_check, self.conn, params = (race, date, gender)) #, distance))
+        if len(x) > 0 and self.curs.execute("SELECT COUNT(*) FROM main.tRace WHERE race_id = ?;", (int(x.iloc[0,0]),)).fetchall()[0][0] == 0:
+            raise ValueError(race + ' (' + date + ') is in a frozen season, whose results can no longer be changed.')
+        if len(x) > 0 and gender is not None:
+            self.curs.execute("UPDATE main.tRace SET gender = ? WHERE race_id = ? AND gender IS NULL;", (gender, int(x.iloc[0,0])))
         
         # if not, create it (run an INSERT)
         if len(x) == 0:
             sqlite3.register_adapter(np.int64, lambda val: int(val))
-            sql_insert = "INSERT INTO tRace (race, date) VALUES (?, ?);"
-            self.curs.execute(sql_insert, (race, date)) #, distance))
-        x = pd.read_sql(sql_check, self.conn, params = (race, date)) #, distance))
+            race_date = self.parse_race_date(date)
+            # race_ids stay unique across the frozen season files (tRace here is the view over all of them)
+            sql_insert = '''
+            INSERT INTO main.tRace (race_id, race, date, gender, race_date, season)
+            VALUES ((SELECT IFNULL(MAX(race_id), 0) + 1 FROM tRace), ?, ?, ?, ?, ?)
+            ;'''
+            self.curs.execute(sql_insert, (race, date, gender, race_date, self.season_of(race_date))) #, distance))
+        x = pd.read_sql(sql_check, self.conn, params = (race, date, gender)) #, distance))
         # return it   
         race_id = x.iloc[0,0]
         return race_id
 
     
     def load_results(self, url:str, gender = 'women', drop_dnf=True, drop_dns=True):
+        '''
+        Scrapes a TFRRS race page (see get_results) and loads the results into the database.
+        Returns the race_id the results were stored under, or None if the page had no results.
+        To load both genders and the team results from one download, use load_meet.
+        '''
         frame = self.get_results(url, gender, drop_dnf, drop_dns)
+        return self.store_results(frame, gender)
+
+
+    def load_meet(self, url:str, drop_dnf=True, drop_dns=True):
+        '''
+        Scrapes a TFRRS race page once (see get_meet_results) and loads the men's and women's individual
+        results and the team results into the database, each gender as its own race.
+        Returns a dictionary of the race_id each gender was stored under.
+        '''
+        meet = self.get_meet_results(url, drop_dnf, drop_dns)
+        race_ids = {}
+        for gender in ['women', 'men']:
+            if meet[gender] is not None:
+                teams = meet['teams'][meet['teams']['GENDER'] == gender]
+                race_ids[gender] = self.store_results(meet[gender], gender, teams)
+        return race_ids
+
+
+    def update_runner_stats(self, race_id=None):
+        '''
+        Recomputes tRunnerStats (number of races, mean, best and latest time) for the runners in race_id,
+        so loading a race only touches the runners who ran it. With no race_id every runner is recomputed.
+        The latest race is the one with the latest date, with undated races counted as oldest.
+        Expects an open connection.
+        '''
+        if race_id is None:
+            runners = 'SELECT runner_id FROM tRaceResult'
+            params = ()
+        else:
+            runners = 'SELECT runner_id FROM tRaceResult WHERE race_id = ?'
+            params = (int(race_id),)
+        sql = '''
+        INSERT OR REPLACE INTO tRunnerStats (runner_id, num_races, mean_time, best_time, latest_race_id, latest_time)
+        WITH Ranked AS
+        (
+            SELECT tRaceResult.runner_id, tRaceResult.race_id, tRaceResult.time,
+                ROW_NUMBER() OVER (PARTITION BY tRaceResult.runner_id
+                                   ORDER BY tRace.race_date IS NULL, tRace.race_date DESC, tRaceResult.race_id DESC) AS recency
+            FROM tRaceResult
+            JOIN tRace USING (race_id)
+            WHERE tRaceResult.runner_id IN (''' + runners + ''')
+        )
+        SELECT runner_id, COUNT(*), AVG(time), MIN(time),
+            MAX(CASE WHEN recency = 1 THEN race_id END), MAX(CASE WHEN recency = 1 THEN time END)
+        FROM Ranked
+        GROUP BY runner_id
+        ;'''
+        self.curs.execute(sql, params)
+        return
+
+
+    @writes
+    def store_results(self, frame, gender=None, teams=None):
+        '''
+        Loads scraped individual results (and optionally the matching team results) into the database.
+        Returns the race_id they were stored under, or None if frame is empty.
+        '''
         self.connect()
+        race_id = None
         # cols = [ ... ]
         # new_sales_file.columns = cols
         
         for i, row in enumerate(frame.to_dict(orient='records')):
-            # get or create runner_id for this name/eligibility/school combo (use get_runner_id)
-            runner_id = self.get_runner_id(row['NAME'], row['YEAR'], row['TEAM'])
-            # get or create race_id for this race/date combo
-            race_id = self.get_race_id(row['COURSE'], row['DATE']) # add distance
-            # fill in tables
-            row['runner_id'] = runner_id
-            row['race_id'] = race_id
             try:
+                # get or create race_id for this race/date combo
+                race_id = self.get_race_id(row['COURSE'], row['DATE'], gender) # add distance
+                # get or create runner_id for this name/eligibility/school combo (use get_runner_id)
+                runner_id = self.get_runner_id(row['NAME'], row['YEAR'], row['TEAM'], race_id, gender)
+                # fill in tables
+                row['runner_id'] = runner_id
+                row['race_id'] = race_id
                 sql = '''
-                INSERT INTO tRaceResult (runner_id, race_id, time, raw_time, place) VALUES (:runner_id, :race_id, :CONVERTED, :TIME, :PL)
+                INSERT INTO main.tRaceResult (runner_id, race_id, time, raw_time, place) VALUES (:runner_id, :race_id, :CONVERTED, :TIME, :PL)
                 ;'''
                 self.curs.execute(sql, row) 
             except Exception as e:
@@ -271,45 +1099,145 @@ class CoursesDB:
                 self.conn.rollback() # Undo everything since the last commit 
                 self.close()
                 raise e
+
+        # team results go with the same race
+        if teams is not None and race_id is not None:
+            sql = '''
+            INSERT OR REPLACE INTO main.tTeamResult (race_id, school, place, score) VALUES (?, ?, ?, ?)
+            ;'''
+            self.curs.executemany(sql, [(int(race_id), row.TEAM, None if pd.isna(row.PL) else int(row.PL),
+                                         None if pd.isna(row.SCORE) else int(row.SCORE)) for row in teams.itertuples(index=False)])
+        if race_id is not None:
+            self.update_runner_stats(race_id)
+        self.bump_data_version()
         self.conn.commit()
         self.close()
-        return None
+        return int(race_id) if race_id is not None else None
 
 
         '''
         ------------------------------------------------- BASIC QUERIES --------------------------------------------------------------
         '''
-    def see_loaded_races(self):
+    @season_scoped
+    def see_loaded_races(self, season=None, start_date=None, end_date=None):
         '''
-        Outputs a list of all races that have been loaded into the database
+        Outputs a list of all races that have been loaded into the database,
+        or only those in a season or date range (see scope_filter)
         '''
 
-        results = self.run_query('''SELECT * FROM tRace''')
+        scope, params = self.scope_filter(season, start_date, end_date)
+        results = self.run_query('''SELECT * FROM tRace WHERE ''' + scope + ''' ORDER BY race_id''', params = tuple(params))
         
         return results
 
     
-    def course_lookup(self, partial_race_name:str):
+    def search_pattern(self, partial:str, prefix=False):
         '''
-        Finds courses with partial_race_name as a keyword and return all races with that fragment in their name
+        Builds the LIKE pattern for the lookup functions: a substring match by default,
+        or a match at the start of the text if prefix is True
+        '''
+        return (partial if prefix else '%' + partial) + '%'
+
+
+    def course_lookup(self, partial_race_name:str, prefix=False, limit=None):
+        '''
+        Finds courses with partial_race_name as a keyword and return all races with that fragment in their name.
+        Set prefix=True to only match races whose name starts with the fragment, and limit to cap the number of rows.
+        Uses the trigram index in tRaceSearch, so fragments of 3 or more characters don't scan tRace.
         '''
         sql = '''
-        SELECT * FROM tRace
-        WHERE race LIKE '%' || :partial_name || '%' 
+        SELECT tRace.race_id, tRace.race, tRace.date
+        FROM tRaceSearch
+        JOIN tRace ON tRace.race_id = tRaceSearch.rowid
+        WHERE tRaceSearch.race LIKE :pattern
+        ORDER BY tRace.race_id
+        LIMIT :limit
+        ;'''
+        params = {'pattern': self.search_pattern(partial_race_name, prefix), 'limit': -1 if limit is None else limit}
+        results = self.run_query(sql, params)
+        return results
+
+
+    def runner_lookup(self, partial_runner_name:str, prefix=False, limit=None):
+        '''
+        Finds runners with partial_runner_name as a keyword and return all runners with that fragment in their name.
+        Set prefix=True to only match names that start with the fragment, and limit to cap the number of rows.
+        Uses the trigram index in tRunnerSearch, so fragments of 3 or more characters don't scan tRunner.
+        '''
+        sql = '''
+        SELECT tRunner.runner_id, tRunner.name, tRunner.eligibility, tRunner.school
+        FROM tRunnerSearch
+        JOIN tRunner ON tRunner.runner_id = tRunnerSearch.rowid
+        WHERE tRunnerSearch.name LIKE :pattern
+        ORDER BY tRunner.runner_id
+        LIMIT :limit
         ;'''
-        results = self.run_query(sql, {'partial_name': partial_race_name})
+        params = {'pattern': self.search_pattern(partial_runner_name, prefix), 'limit': -1 if limit is None else limit}
+        results = self.run_query(sql, params)
         return results
 
 
-    def runner_lookup(self, partial_runner_name:str):
+    def school_lookup(self, partial_school_name:str, prefix=False, limit=None):
+        '''
+        Finds schools with partial_school_name as a keyword and returns each matching school once, in alphabetical order.
+        Set prefix=True to only match schools that start with the fragment, and limit to cap the number of rows.
+        '''
+        sql = '''
+        SELECT DISTINCT tRunner.school
+        FROM tRunnerSearch
+        JOIN tRunner ON tRunner.runner_id = tRunnerSearch.rowid
+        WHERE tRunnerSearch.school LIKE :pattern
+        ORDER BY tRunner.school
+        LIMIT :limit
+        ;'''
+        params = {'pattern': self.search_pattern(partial_school_name, prefix), 'limit': -1 if limit is None else limit}
+        results = self.run_query(sql, params)
+        return results
+
+    
+    @season_scoped
+    def export_results(self, path:str, file_format='csv', chunksize=10000, season=None, start_date=None, end_date=None):
+        '''
+        Writes every race result, joined with its runner and race, to path as CSV or, with file_format='json', as JSON lines
+        (one result per line). season, start_date and end_date limit the export (see scope_filter).
+        The rows are streamed with iter_query, so memory use stays the same however big the database gets.
+        '''
+        if file_format not in ('csv', 'json'):
+            raise ValueError("file_format must be 'csv' or 'json'")
+        scope, params = self.scope_filter(season, start_date, end_date)
+        sql = '''
+        SELECT tRunner.runner_id, tRunner.name, tRunner.eligibility, tRunner.school, tRaceResult.race_id, tRaceResult.raw_time,
+            tRaceResult.time, tRaceResult.place, tRace.race, tRace.gender, tRace.date
+        FROM tRunner
+        JOIN tRaceResult USING (runner_id)
+        JOIN tRace USING (race_id)
+        WHERE ''' + scope + '''
+        ORDER BY tRaceResult.race_id, tRaceResult.place
+        ;'''
+        with open(path, 'w', newline='') as export_file:
+            for i, chunk in enumerate(self.iter_query(sql, tuple(params), chunksize)):
+                if file_format == 'csv':
+                    chunk.to_csv(export_file, header=(i == 0), index=False)
+                else:
+                    chunk.to_json(export_file, orient='records', lines=True)
+        return
+
+
+    def team_roster(self, school:str):
         '''
-        Finds runners with partial_runner_name as a keyword and return all runners with that fragment in their name
+        Lists a school's runners with their number of races and their mean, best and latest times, fastest first.
+        Reads the precomputed aggregates in tRunnerStats instead of going through every result.
         '''
         sql = '''
-        SELECT * FROM tRunner
-        WHERE name LIKE '%' || :partial_name || '%' 
+        SELECT tRunner.runner_id, tRunner.name, tRunner.eligibility, tRunnerStats.num_races, tRunnerStats.mean_time,
+            tRunnerStats.best_time, tRunnerStats.latest_time, tRace.race AS latest_race
+        FROM tRunner
+        JOIN tRunnerStats USING (runner_id)
+        LEFT JOIN tRace ON tRace.race_id = tRunnerStats.latest_race_id
+        WHERE tRunner.school = :school
+        ORDER BY tRunnerStats.best_time
         ;'''
-        results = self.run_query(sql, {'partial_name': partial_runner_name})
+        results = self.run_query(sql, {'school': school})
         return results
 
     
@@ -335,7 +1263,55 @@ class CoursesDB:
         ------------------------------------------------- CONVERSIONS AND STATISTICS -------------------------------------------------
         '''
     
-    def compare_two_courses(self, RaceIDOne:int, RaceIDTwo:int):  
+    def shared_times(self, race_ids:list):
+        '''
+        Returns a table of race times with one row per runner and one column per race in race_ids.
+        Races a runner didn't run are NaN, so the runners shared by two races are the rows where both columns have a time.
+        '''
+        sql = 'SELECT runner_id, race_id, time FROM tRaceResult WHERE race_id IN (' + ', '.join(['?']*len(race_ids)) + ');'
+        results = self.run_query(sql, params = tuple(int(race_id) for race_id in race_ids))
+        return results.pivot(index='runner_id', columns='race_id', values='time')
+
+
+    def bootstrap_ratio_se(self, times_one, times_two, n_boot=1000, seed=0):
+        '''
+        Standard error of the ratio mean(times_two) / mean(times_one) for paired times from the same runners.
+        The runners are resampled with replacement n_boot times in a single NumPy operation and the spread
+        of the resampled ratios is returned. Returns NaN if fewer than 2 runners are shared.
+        '''
+        times_one = np.asarray(times_one, dtype=float)
+        times_two = np.asarray(times_two, dtype=float)
+        n = len(times_one)
+        if n < 2:
+            return np.nan
+        rng = np.random.default_rng(seed)
+        samples = rng.integers(0, n, size=(n_boot, n)) # each row is one resample of runner positions
+        ratios = times_two[samples].mean(axis=1) / times_one[samples].mean(axis=1)
+        return ratios.std(ddof=1)
+
+
+    def ratio_standard_errors(self, pairs:list, n_boot=1000):
+        '''
+        Bootstrap standard errors (see bootstrap_ratio_se) for the ratio of each (RaceIDOne, RaceIDTwo) pair in pairs,
+        matching the Ratio from compare_two_courses. The times are read in one query and the pairs are resampled in
+        parallel threads. Returns a dictionary keyed by pair.
+        '''
+        if len(pairs) == 0:
+            return {}
+        times = self.shared_times(list({race_id for pair in pairs for race_id in pair}))
+
+        def pair_se(pair):
+            if pair[0] not in times.columns or pair[1] not in times.columns:
+                return np.nan
+            both = times[[pair[0], pair[1]]].dropna() # runners with a time in both races
+            return self.bootstrap_ratio_se(both[pair[0]], both[pair[1]], n_boot)
+
+        with ThreadPoolExecutor() as pool:
+            standard_errors = list(pool.map(pair_se, pairs))
+        return dict(zip(pairs, standard_errors))
+
+
+    def compare_two_courses(self, RaceIDOne:int, RaceIDTwo:int, standard_error=False):  
         '''
         This function compares two courses specified by their race_id's.
         It will output the difference in seconds in average race times (difference), the ratio of average race times (ratio), and
@@ -345,75 +1321,61 @@ class CoursesDB:
         'ratio' is the number that race times from the first course would need to be multiplied by in order to standardize them to the second 
         course; the average time from the first course multiplied by 'ratio' should yield the average time from the second course.
         This function only compares times in runners who competed in both meets. The number of runners in common is shown as NumCompared.
+        'RatioSE' is the bootstrap standard error of 'ratio' (see ratio_standard_errors), only added with standard_error=True
+        since it resamples the runners in common.
         '''
 
         
+        # one pass over the results: each runner's time in race one is joined to their time in race two,
+        # so only runners who ran both are counted. idx_tRaceResult_race covers both sides of the join
         sql = '''
-        WITH CommonRunnersTable AS
-        (
-            WITH CommonRunnersList AS
-            (
-                    SELECT runner_id, race_id, COUNT(*) AS NumRaces
-                    FROM tRaceResult
-                    WHERE race_id LIKE :RaceIDOne OR race_id LIKE :RaceIDTwo 
-                    GROUP BY runner_id
-                    HAVING NumRaces > 1 
-            )
-        SELECT runner_id FROM CommonRunnersList
-        ),
-        
-        CourseOne AS
-        (
-        SELECT Avg(time) AS AvgCourseOne, COUNT(*) AS NumCompared
-        FROM tRaceResult
-        WHERE runner_id IN CommonRunnersTable AND race_id LIKE :RaceIDOne
-        ),
-        
-        CourseTwo AS
-        (
-        SELECT Avg(time) AS AvgCourseTwo
-        FROM tRaceResult
-        WHERE runner_id IN CommonRunnersTable AND race_id LIKE :RaceIDTwo
-        ),
-        
-        BothCourses AS
-        (
-        SELECT AvgCourseOne, AvgCourseTwo, NumCompared
-        FROM CourseOne
-        JOIN CourseTwo
-        )
-        
-        SELECT AvgCourseTwo - AvgCourseOne AS Difference, AvgCourseTwo / AvgCourseOne AS Ratio, NumCompared
-        FROM BothCourses
-
+        SELECT AVG(two.time) - AVG(one.time) AS Difference, AVG(two.time) / AVG(one.time) AS Ratio, COUNT(*) AS NumCompared
+        FROM tRaceResult AS one
+        JOIN tRaceResult AS two
+        ON two.runner_id = one.runner_id AND two.race_id = :RaceIDTwo
+        WHERE one.race_id = :RaceIDOne
         ;'''
                     
         results = self.run_query(sql, {'RaceIDOne':RaceIDOne, 'RaceIDTwo':RaceIDTwo}) 
+        if standard_error:
+            results['RatioSE'] = self.ratio_standard_errors([(RaceIDOne, RaceIDTwo)])[(RaceIDOne, RaceIDTwo)]
         
         return results
 
 
     
-    def predict_times(self, target_course_id:int):
+    @season_scoped
+    def predict_times(self, target_course_id:int, season=None, start_date=None, end_date=None, half_life_days=None):
         '''
         Predicts times for runners on a specific course
+        season, start_date and end_date limit the prediction to results from races in that season or date range (see scope_filter).
+        With half_life_days set, recent races count for more: a race half_life_days older than the newest race in the
+        results gets half the weight in each runner's average. Races without a readable date count as the oldest.
         '''
        
         #gets all the runners who results from multiple races
+        scope, params = self.scope_filter(season, start_date, end_date)
+        if len(params) == 0: # all races, so the precomputed race counts apply
+            multi_race_runners = 'SELECT runner_id FROM tRunnerStats WHERE num_races > 1'
+        else:
+            multi_race_runners = 'SELECT runner_id FROM ScopedResults GROUP BY runner_id HAVING COUNT(race_id) > 1'
         sql = '''
-        SELECT tRaceResult.runner_id, tRunner.name, tRunner.school, tRaceResult.race_id, tRaceResult.time, tRaceResult.place
-        FROM tRaceResult
-        JOIN tRunner
-        ON tRaceResult.runner_id = tRunner.runner_id
-        WHERE tRaceResult.runner_id IN (
-            SELECT runner_id
+        WITH ScopedResults AS
+        (
+            SELECT tRaceResult.runner_id, tRaceResult.race_id, tRaceResult.time, tRaceResult.place, tRace.race_date
             FROM tRaceResult
-            GROUP BY runner_id
-            HAVING COUNT(race_id) > 1
+            JOIN tRace USING (race_id)
+            WHERE ''' + scope + '''
         )
+        SELECT ScopedResults.runner_id, tRunner.name, tRunner.school, ScopedResults.race_id, ScopedResults.time,
+            ScopedResults.place, ScopedResults.race_date
+        FROM ScopedResults
+        JOIN tRunner
+        ON ScopedResults.runner_id = tRunner.runner_id
+        WHERE ScopedResults.runner_id IN (''' + multi_race_runners + ''')
         ;'''
    
-        shared_runners_df = self.run_query(sql)
+        shared_runners_df = self.run_query(sql, params = tuple(params), compact=True)
        
         #groups data by course and gets average time for each course
         avg_times_per_course = shared_runners_df.groupby('race_id')['time'].mean().reset_index()
@@ -434,35 +1396,35 @@ class CoursesDB:
         how = 'left'
         )
    
-        #loops through dataframe for all unique runner ids and creates a predicted time by multiplying the course's difficulty ratio by the course time, then takes the average of the difficulty ratio-adjusted course times
-        predicted_times = []
-        for runner_id in shared_runners_ratios['runner_id'].unique():
-            runner_data = shared_runners_ratios[shared_runners_ratios['runner_id'] == runner_id]
-       
-            predicted_time = (runner_data['time'] * runner_data['difficulty_ratio']).mean()
-        
-            runner_name = runner_data['name'].iloc[0]
-            
-            runner_school = runner_data['school'].iloc[0]
-           
-            
-            #convert to minutes:seconds format
-            minutes = int(predicted_time // 60)
-            seconds = int(predicted_time % 60)
-            formatted_time = f"{minutes}:{seconds:02d}"
-       
-            predicted_times.append({'runner_id': runner_id, 
-                                    'name': runner_name, 
-                                    'school': runner_school, 
-                                    'predicted_time': predicted_time, 
-                                    'formatted_time': formatted_time})
- 
-        predictions_df = pd.DataFrame(predicted_times)
+        #for each runner, multiply each course time by the course's difficulty ratio, then take the average of the difficulty ratio-adjusted course times
+        shared_runners_ratios['adjusted_time'] = shared_runners_ratios['time'] * shared_runners_ratios['difficulty_ratio']
+        race_dates = pd.to_datetime(shared_runners_ratios['race_date'].astype(object))
+        if half_life_days is None or race_dates.isna().all(): # with no dates to go by, every race counts the same
+            shared_runners_ratios['weight'] = 1.0
+        else:
+            age_days = (race_dates.max() - race_dates.fillna(race_dates.min())).dt.days
+            shared_runners_ratios['weight'] = 0.5 ** (age_days / half_life_days)
+        #a weighted average: sum of weight * adjusted time over sum of weights (all weights are 1 without half_life_days)
+        shared_runners_ratios['weighted_time'] = shared_runners_ratios['adjusted_time'] * shared_runners_ratios['weight']
+        predictions_df = shared_runners_ratios.groupby('runner_id', sort=False, observed=True).agg(
+            name = ('name', 'first'),
+            school = ('school', 'first'),
+            weighted_time = ('weighted_time', 'sum'),
+            weight = ('weight', 'sum')
+            ).reset_index()
+        predictions_df['predicted_time'] = predictions_df['weighted_time'] / predictions_df['weight']
+        predictions_df = predictions_df[['runner_id', 'name', 'school', 'predicted_time']]
+
+        #convert to minutes:seconds format
+        minutes = (predictions_df['predicted_time'] // 60).astype(int).astype(str)
+        seconds = (predictions_df['predicted_time'] % 60).astype(int).astype(str).str.zfill(2)
+        predictions_df['formatted_time'] = minutes + ':' + seconds
    
         return predictions_df
 
 
-    def conversions(self, primary_race_id:int, min_comparisons = 15):
+    @season_scoped
+    def conversions(self, primary_race_id:int, min_comparisons = 15, season=None, start_date=None, end_date=None):
         '''
         connects courses together to compare times
         User specifies one race they want to be the point of comparison. All other courses are given a ratio based on how much 
@@ -472,11 +1434,16 @@ class CoursesDB:
         default to 15 if not set.
         A positive value for time_conversion and a value of ratio_conversion greater than 1 both indicate that a course was slower
         than the primary course
+        ratio_se is the standard error of ratio_conversion. Courses compared directly with the primary use the bootstrap
+        standard error of their ratio (see ratio_standard_errors). For courses converted through other courses, the errors of
+        each step are combined with the delta method, treating the steps as independent. It is NaN when a step
+        has only one runner in common, since there is nothing to estimate the spread from.
+        season, start_date and end_date limit the conversions to the races in that season or date range (see scope_filter).
         '''
 
-        coursesdf = self.see_loaded_races() # look up all the courses loaded into the database
+        coursesdf = self.see_loaded_races(season, start_date, end_date) # look up all the courses loaded into the database
         num_races = len(coursesdf) # find number of races loaded
-        if primary_race_id > num_races: # error prevention
+        if primary_race_id not in coursesdf['race_id'].tolist(): # error prevention
             print('Race ID out of range')
             return None
         convert_ratio = [None] * num_races # create a list of the right length
@@ -485,51 +1452,40 @@ class CoursesDB:
         convert_time = [None] * num_races
         coursesdf['time_conversion'] = convert_time
         coursesdf.loc[coursesdf['race_id'] == primary_race_id, 'time_conversion'] = 0 # set the primary course time difference as 0
+        coursesdf['ratio_se'] = np.nan
+        coursesdf.loc[coursesdf['race_id'] == primary_race_id, 'ratio_se'] = 0 # the primary course is exact
         
         
         # select all the courses except the one listed as primary
-        course_list = self.run_query('''
-            SELECT race_id
-            FROM tRace
-            WHERE race_id NOT LIKE :primary_race
-            ;''',
-            {"primary_race":primary_race_id})['race_id'].tolist()
+        course_list = [race_id for race_id in coursesdf['race_id'].tolist() if race_id != primary_race_id]
 
         # find all the courses that share at least 'min_comparisons' runners with the primary
         secondary_list = []
         non_secondary_list = []
         quaternary_list = []
         unusable_courses = []
+        primary_results = {} # each comparison with the primary, kept for the secondary conversions below
         for id in course_list:
-            common = self.run_query('''
-                WITH CommonRunnersList AS
-                (
-                        SELECT runner_id, race_id, COUNT(*) AS NumRaces
-                        FROM tRaceResult
-                        WHERE race_id LIKE :RaceIDOne OR race_id LIKE :RaceIDTwo 
-                        GROUP BY runner_id
-                        HAVING NumRaces > 1 
-                )
-                
-                SELECT COUNT(runner_id) AS CommonRunners
-                FROM CommonRunnersList
-                ;''',
-                {'RaceIDOne':primary_race_id, 'RaceIDTwo':id}).iat[0,0] # the .iat[0,0] part grabs the value from the df
+            primary_results[id] = self.compare_two_courses(primary_race_id, id)
+            common = primary_results[id].loc[0,'NumCompared']
             if common > 14:
                 secondary_list.append(id)
             else: 
                 non_secondary_list.append(id)
 
+        # standard errors for all the secondary ratios at once
+        secondary_se = self.ratio_standard_errors([(primary_race_id, item) for item in secondary_list])
         for item in secondary_list:
             secondary_race_id = item
-            # run the comparison function for each race with enough runners in common with primary race
-            results = self.compare_two_courses(primary_race_id, secondary_race_id) 
+            # the comparison for each race with enough runners in common with primary race
+            results = primary_results[secondary_race_id]
             
             time_diff = results.loc[0,'Difference'] # from the results, grab the average difference in seconds
             coursesdf.loc[coursesdf['race_id'] == secondary_race_id, 'time_conversion'] = time_diff
             
             ratio = results.loc[0,'Ratio'] # from the results, grab the average ratio difference
             coursesdf.loc[coursesdf['race_id'] == secondary_race_id, 'ratio_conversion'] = ratio
+            coursesdf.loc[coursesdf['race_id'] == secondary_race_id, 'ratio_se'] = secondary_se[(primary_race_id, secondary_race_id)]
 
         # select all the courses that aren't tertiary
         all_courses = coursesdf['race_id'].tolist() # select all courses
@@ -554,21 +1510,27 @@ class CoursesDB:
             tertiary_table['race_id'] = used_race_ids
             tertiary_table2 = pd.merge(
                 tertiary_table,
-                coursesdf[['race_id','ratio_conversion','time_conversion']],
+                coursesdf[['race_id','ratio_conversion','time_conversion','ratio_se']],
                 on = 'race_id',
                 how = 'inner')
         
             this_ratio = 0
             this_diff = 0
+            this_var = 0
             total_comparisons = tertiary_table2['NumCompared'].sum() # find the total number of runners compared - used to weight each race average
             if total_comparisons > min_comparisons:    
+                pair_se = self.ratio_standard_errors([(race, tertiary_race_id) for race in tertiary_table2['race_id']])
                 for row in tertiary_table2.itertuples(index=False): # iterate thru tuples to calculate
+                    # variance of Ratio*ratio_conversion by the delta method, scaled by the squared weight
+                    this_var += (row.Ratio*row.ratio_conversion)**2 * ((pair_se[(row.race_id, tertiary_race_id)]/row.Ratio)**2
+                        + (row.ratio_se/row.ratio_conversion)**2) * (row.NumCompared/total_comparisons)**2
                     this_ratio += row.Ratio*row.ratio_conversion*row.NumCompared/total_comparisons # new ratio is primary:secondary * secondary:teriary * weight
                     this_diff += (row.Difference + row.time_conversion)*row.NumCompared/total_comparisons 
                     # new time diff is ((secondary - primary) + (teriary - secondary)) * weight based on number of runners compared
     
                 coursesdf.loc[coursesdf['race_id'] == tertiary_race_id, 'ratio_conversion'] = this_ratio # add calculated ratio to dataframe
                 coursesdf.loc[coursesdf['race_id'] == tertiary_race_id, 'time_conversion'] = this_diff # add calculated time difference to dataframe
+                coursesdf.loc[coursesdf['race_id'] == tertiary_race_id, 'ratio_se'] = np.sqrt(this_var)
             else:
                 quaternary_list.append(item)
 
@@ -595,15 +1557,20 @@ class CoursesDB:
             quaternary_table['race_id'] = used_race_ids
             quaternary_table2 = pd.merge(
                 quaternary_table,
-                coursesdf[['race_id','ratio_conversion','time_conversion']],
+                coursesdf[['race_id','ratio_conversion','time_conversion','ratio_se']],
                 on = 'race_id',
                 how = 'inner')
         
             this_ratio = 0
             this_diff = 0
+            this_var = 0
             total_comparisons = quaternary_table2['NumCompared'].sum() # find the total number of runners compared - used to weight each race average
             if total_comparisons > min_comparisons:    
+                pair_se = self.ratio_standard_errors([(race, quaternary_race_id) for race in quaternary_table2['race_id']])
                 for row in quaternary_table2.itertuples(index=False): # iterate thru tuples to calculate
+                    # variance of Ratio*ratio_conversion by the delta method, scaled by the squared weight
+                    this_var += (row.Ratio*row.ratio_conversion)**2 * ((pair_se[(row.race_id, quaternary_race_id)]/row.Ratio)**2
+                        + (row.ratio_se/row.ratio_conversion)**2) * (row.NumCompared/total_comparisons)**2
                     this_ratio += row.Ratio*row.ratio_conversion*row.NumCompared/total_comparisons 
                     # new ratio is primary:secondary * secondary:teriary * tertiary:quaternary * weight
                     this_diff += (row.Difference + row.time_conversion)*row.NumCompared/total_comparisons 
@@ -611,6 +1578,7 @@ class CoursesDB:
     
                 coursesdf.loc[coursesdf['race_id'] == quaternary_race_id, 'ratio_conversion'] = this_ratio # add calculated ratio to dataframe
                 coursesdf.loc[coursesdf['race_id'] == quaternary_race_id, 'time_conversion'] = this_diff # add calculated time difference to dataframe
+                coursesdf.loc[coursesdf['race_id'] == quaternary_race_id, 'ratio_se'] = np.sqrt(this_var)
             else:
                 unusable_courses.append(item)
                 print('Note: not enough information to compare race ' + str(item) + '. Only ' + str(total_comparisons) + ' runners in common.')
@@ -618,8 +1586,9 @@ class CoursesDB:
         return coursesdf 
     
     
-    def predict_team_results(self, school:str, course_id:int):
-        predictions_df = self.predict_times(course_id)
+    @season_scoped
+    def predict_team_results(self, school:str, course_id:int, season=None, start_date=None, end_date=None, half_life_days=None):
+        predictions_df = self.predict_times(course_id, season, start_date, end_date, half_life_days)
         
         team_results = predictions_df[predictions_df['school'] == school]
         
@@ -628,51 +1597,49 @@ class CoursesDB:
         return team_results
         
 
-    def select_schools(self, schools:list, primary=1):
+    @season_scoped
+    def select_schools(self, schools:list, primary=1, season=None, start_date=None, end_date=None):
         '''
         Inputs a list of schools and a race, and a primary course ID which defaults to 1, outputs the results from each 
-        race of all runners from these two schools after having standardized these results with the conversions function
-        '''
-        schools_tuple = tuple(schools)
-        # grab all runners in the database from the selected schools
-        # the .join part adds the number of question marks needed to the query based on how many schools are selected
-        query = 'SELECT runner_id, school FROM tRunner WHERE school IN (' + str(', '.join(['?']*len(schools))) + ');' 
-        racers = self.run_query(query, params = schools_tuple)
-        results = self.run_query('''SELECT runner_id, race_id, time FROM tRaceResult ;''')
-
-        # get all the race results from the database for runners in the specified schools
-        runner_results = pd.merge(
-        racers,
-        results,
-        on = 'runner_id',
-        how = 'left'
-        )
-
+        race of all runners from these two schools after having standardized these results with the conversions function.
+        Only the selected schools' runners and results are read from the database.
+        season, start_date and end_date limit it to races in that season or date range (see scope_filter).
+        '''
         #run the conversion function
-        race_conversions = self.conversions(primary)
-        race_conversions.drop(['race', 'date','time_conversion'], axis=1, inplace=True) # remove extra columns
-        race_conversions = race_conversions.dropna() # remove courses that couldn't be converted
-
-        # convert all the times
-        converted_results = pd.merge(
-            runner_results,
-            race_conversions,
-            on = 'race_id',
-            how = 'inner'
-            )
-        converted_results['time_conversion'] = converted_results.time / converted_results.ratio_conversion # standardize
-        converted_results = converted_results[['runner_id','race_id','time_conversion']]
+        race_conversions = self.conversions(primary, season=season, start_date=start_date, end_date=end_date)
+        if race_conversions is None: # the primary race isn't in the season or date range
+            return pd.DataFrame(columns = ['runner_id','name','school','race_id','time_conversion'])
+        race_conversions = race_conversions[['race_id','ratio_conversion']].dropna() # remove courses that couldn't be converted
+        if len(race_conversions) == 0 or len(schools) == 0:
+            return pd.DataFrame(columns = ['runner_id','name','school','race_id','time_conversion'])
+
+        # one query for the selected schools only: their runners, their results, and the conversion factor for each race.
+        # the conversion factors are passed in as a VALUES list, and the .join parts add the number of question marks
+        # needed for the conversions and the schools
+        query = '''
+        WITH Conversions(race_id, ratio_conversion) AS (VALUES ''' + ', '.join(['(?, ?)']*len(race_conversions)) + ''')
+        SELECT tRunner.runner_id, tRunner.name, tRunner.school, tRaceResult.race_id,
+            tRaceResult.time / Conversions.ratio_conversion AS time_conversion
+        FROM tRunner
+        JOIN tRaceResult USING (runner_id)
+        JOIN Conversions USING (race_id)
+        WHERE tRunner.school IN (''' + ', '.join(['?']*len(schools)) + ''')
+        ;'''
+        params = [value for row in race_conversions.itertuples(index=False) for value in (int(row.race_id), float(row.ratio_conversion))]
+        converted_results = self.run_query(query, params = tuple(params) + tuple(schools), compact = True)
         
         return converted_results
 
 
-    def virtual_race(self, schools:list, primary=1):
+    @season_scoped
+    def virtual_race(self, schools:list, primary=1, season=None, start_date=None, end_date=None):
         ''' 
         Inputs a list of schools to run a virutal meet against and a course to set as primary (defaults to 1), 
         outputs the expected results from a meet with those teams
+        season, start_date and end_date limit it to races in that season or date range (see scope_filter).
         '''
         #get the list of runners and their converted times at each race from the select_schools function
-        converted_results = self.select_schools(schools, primary)
+        converted_results = self.select_schools(schools, primary, season, start_date, end_date)
 
         # pivot the table so all the runners (runner_id's) are the rows and each race is a column
         results_table = converted_results.pivot(index='runner_id', columns='race_id', values='time_conversion')
@@ -681,8 +1648,8 @@ class CoursesDB:
         # only select the runner_ids and average times
         average_times = results_table[['average_time']]
         average_times.reset_index(inplace=True) # turn runner_id back from index to normal column
-        # now grab all the runner names and schools from tRunner
-        runners = self.run_query('''SELECT runner_id, name, school FROM tRunner;''')
+        # names and schools came back with the converted results, so match them to the average times
+        runners = converted_results[['runner_id','name','school']].drop_duplicates('runner_id')
         race = pd.merge(  # create match average times to a runner's name and school
             average_times,
             runners,
@@ -695,3 +1662,99 @@ class CoursesDB:
         race.drop(['index','average_time'], axis=1, inplace=True)
         
         return race
+
+
+        '''
+        ------------------------------------------------- PRECOMPUTED RESULTS --------------------------------------------------------
+        '''
+
+    def precompute(self, workers=None):
+        '''
+        Computes the conversions, predicted times and pair statistics (compare_two_courses against every other race)
+        with every race as the primary race, spread over a pool of worker processes (workers defaults to one per CPU).
+        The results are stored in tPrecomputed stamped with the current data version, replacing earlier ones, and
+        get_precomputed serves them until the data changes. Meant to run as a nightly job: python courses.py precompute
+        Returns the number of races precomputed, or 0 if results were loaded while it ran (nothing is stored then).
+        '''
+        version = self.data_version()
+        race_ids = self.see_loaded_races()['race_id'].tolist()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(precompute_race, [self.path_db]*len(race_ids), race_ids))
+
+        with self.write_lock():
+            self.connect()
+            if self.curs.execute("PRAGMA user_version;").fetchall()[0][0] != version:
+                self.close()
+                print('Note: the data changed while precomputing, so the results were not stored.')
+                return 0
+            self.curs.execute("DELETE FROM tPrecomputed;")
+            sql = "INSERT INTO tPrecomputed (kind, race_id, data_version, result) VALUES (?, ?, ?, ?);"
+            self.curs.executemany(sql, [(kind, int(race_id), version, result)
+                                        for race_id, race_results in results for kind, result in race_results.items()])
+            self.conn.commit()
+            self.close()
+        return len(results)
+
+
+    def get_precomputed(self, kind:str, race_id:int):
+        '''
+        Returns the stored result of precompute for one race as a DataFrame: kind is 'conversions' (conversions with race_id
+        as the primary), 'predictions' (predict_times for race_id) or 'pairs' (compare_two_courses from race_id to each
+        other race, with the other race in race_id_two). Returns None if it hasn't been precomputed since the data last changed.
+        '''
+        self.connect()
+        sql = '''
+        SELECT result FROM tPrecomputed
+        WHERE kind = ? AND race_id = ? AND data_version = ?
+        ;'''
+        version = self.curs.execute("PRAGMA user_version;").fetchall()[0][0]
+        rows = self.curs.execute(sql, (kind, int(race_id), version)).fetchall()
+        self.close()
+        if len(rows) == 0:
+            return None
+        return pd.read_json(io.StringIO(rows[0][0]), orient='records', dtype=False, convert_dates=False)
+
+
+def precompute_race(path_db:str, race_id:int):
+    '''
+    Computes the precomputed results (see CoursesDB.precompute) for one primary race and returns them as JSON.
+    Kept outside the class so worker processes can run it.
+    '''
+    db = CoursesDB(path_db, read_only=True)
+    results = {}
+    conversions = db.conversions(race_id)
+    if conversions is not None:
+        results['conversions'] = conversions.to_json(orient='records')
+    try:
+        results['predictions'] = db.predict_times(race_id).to_json(orient='records')
+    except IndexError: # nobody who ran this race has run another one
+        pass
+
+    other_races = [other for other in db.see_loaded_races()['race_id'].tolist() if other != race_id]
+    pairs = [db.compare_two_courses(race_id, other) for other in other_races]
+    if pairs:
+        pairs = pd.concat(pairs, ignore_index=True)
+        pairs['race_id_two'] = other_races
+        # the standard errors of every pair in one batch, rather than one compare_two_courses(standard_error=True) each
+        standard_errors = db.ratio_standard_errors([(race_id, other) for other in other_races])
+        pairs['RatioSE'] = [standard_errors[(race_id, other)] for other in other_races]
+        results['pairs'] = pairs.to_json(orient='records')
+    return race_id, results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tools for the course comparisons database.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    precompute_parser = commands.add_parser('precompute', help='precompute conversions, predictions and pair statistics for every race')
+    precompute_parser.add_argument('--db', default='courses.db', help='path to the database (default courses.db)')
+    precompute_parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default one per CPU)')
+    freeze_parser = commands.add_parser('freeze', help='move a finished season into its own file')
+    freeze_parser.add_argument('season', type=int, help='the season (year) to freeze')
+    freeze_parser.add_argument('--db', default='courses.db', help='path to the database (default courses.db)')
+    args = parser.parse_args()
+
+    if args.command == 'precompute':
+        count = CoursesDB(args.db).precompute(args.workers)
+        print('Precomputed results for ' + str(count) + ' races.')
+    elif args.command == 'freeze':
+        print('Moved season ' + str(args.season) + ' to ' + CoursesDB(args.db).freeze_season(args.season))
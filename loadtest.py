@@ -0,0 +1,50 @@
+'''
+Load test for the dashboard: sends the compare, conversions and predict callbacks to a running dashboard from
+several threads at once and reports requests per second for each. Start the dashboard first, for example
+"python app.py --production --workers 4", then run "python loadtest.py --requests 200 --threads 8".
+'''
+import argparse
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+def callback_body(output, button, states):
+    '''
+    The request Dash's browser code sends when button is clicked, with states as (component id, value) pairs
+    '''
+    component, prop = output.split('.')
+    return {'output': output, 'outputs': {'id': component, 'property': prop},
+            'inputs': [{'id': button, 'property': 'n_clicks', 'value': 1}],
+            'state': [{'id': component_id, 'property': 'value', 'value': value} for component_id, value in states],
+            'changedPropIds': [button + '.n_clicks']}
+
+def call(url, body):
+    request = urllib.request.Request(url + '/_dash-update-component', data=json.dumps(body).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        response.read()
+        return response.status
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test for a running dashboard.')
+    parser.add_argument('--url', default='http://127.0.0.1:8050', help='address of the dashboard')
+    parser.add_argument('--requests', type=int, default=200, help='requests per tab')
+    parser.add_argument('--threads', type=int, default=8, help='requests sent at once')
+    parser.add_argument('--race-one', type=int, default=1, help='race used as the first or primary course')
+    parser.add_argument('--race-two', type=int, default=2, help='race compared with the first one')
+    args = parser.parse_args()
+
+    tabs = {
+        'compare': callback_body('comparison-result.children', 'compare-button',
+                                 [('course-one-dropdown', args.race_one), ('course-two-dropdown', args.race_two)]),
+        'conversions': callback_body('output-2.children', 'full-compare-button', [('full-course-dropdown', args.race_one)]),
+        'predict': callback_body('prediction-result.children', 'predict-button', [('course-dropdown', args.race_one)]),
+    }
+    for name, body in tabs.items():
+        call(args.url, body) # the first request fills the cache
+        start = time.time()
+        with ThreadPoolExecutor(args.threads) as pool:
+            statuses = list(pool.map(lambda _: call(args.url, body), range(args.requests)))
+        elapsed = time.time() - start
+        print(name + ': ' + str(round(args.requests / elapsed, 1)) + ' requests/s, statuses ' + str(sorted(set(statuses))))
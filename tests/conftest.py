@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from courses import CoursesDB
+
+
+@pytest.fixture
+def db(tmp_path):
+    '''
+    An empty database with all tables built
+    '''
+    db = CoursesDB(str(tmp_path / 'courses.db'), create=True)
+    db.build_tables()
+    return db
+
+
+@pytest.fixture
+def race_results():
+    '''
+    Builds a scraped results frame (as from get_results) for store_results from (name, year, school, seconds) rows
+    '''
+    def race_results(course, date, runners):
+        rows = [{'PL': place, 'NAME': name, 'YEAR': year, 'TEAM': school, 'TIME': str(int(seconds // 60)) + ':' + str(int(seconds % 60)).zfill(2),
+                 'CONVERTED': float(seconds), 'COURSE': course, 'DATE': date}
+                for place, (name, year, school, seconds) in enumerate(runners, start=1)]
+        return pd.DataFrame(rows)
+    return race_results
@@ -0,0 +1,39 @@
+import importlib
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def client(db, race_results, tmp_path, monkeypatch):
+    '''
+    A test client for the dashboard's JSON API, serving two races run by the same Elon runners and one run by nobody else
+    '''
+    runners = [('Runner ' + str(i), 'SO-2', 'Elon', 1200 + 10 * i) for i in range(5)]
+    db.store_results(race_results('Course A', 'September 7, 2024', runners), 'women')
+    db.store_results(race_results('Course B', 'September 21, 2024', [(name, year, school, seconds + 30) for name, year, school, seconds in runners]), 'women')
+    db.store_results(race_results('Course C', 'October 5, 2024', [('Other ' + str(i), 'FR-1', 'Duke', 1300 + i) for i in range(5)]), 'women')
+    monkeypatch.chdir(tmp_path) # the app opens courses.db (and keeps its cache) in the working directory
+    monkeypatch.delitem(sys.modules, 'app', raising=False)
+    app = importlib.import_module('app')
+    return app.server.test_client()
+
+
+def test_compare_has_an_etag_and_answers_304_when_unchanged(client):
+    response = client.get('/api/compare?one=1&two=2')
+    assert response.status_code == 200
+    assert response.get_json()[0]['NumCompared'] == 5
+    assert 'RatioSE' in response.get_json()[0] # the compare tab shows the standard error
+    assert response.headers['Cache-Control'] == 'no-cache'
+    again = client.get('/api/compare?one=1&two=2', headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+
+
+@pytest.mark.parametrize('url', ['/api/compare?one=1', '/api/compare?one=1&two=x', '/api/conversions', '/api/meet?primary=1'])
+def test_bad_parameters_are_a_400(client, url):
+    assert client.get(url).status_code == 400
+
+
+@pytest.mark.parametrize('url', ['/api/unknown', '/api/compare?one=1&two=3', '/api/meet?schools=Elon&primary=99'])
+def test_missing_data_is_a_404(client, url):
+    assert client.get(url).status_code == 404
@@ -0,0 +1,34 @@
+import pytest
+
+
+def load_dated_races(db, race_results):
+    runners = [('Runner ' + str(i), 'SO-2', 'Elon', 1200 + 10*i) for i in range(20)]
+    db.store_results(race_results('Invitational', 'September 14, 2024', runners), 'women')
+    db.store_results(race_results('Championship', 'October 26, 2024', [(name, year, school, time + 30) for name, year, school, time in runners]), 'women')
+
+
+def test_half_life_weights_with_no_readable_dates(db, race_results):
+    load_dated_races(db, race_results)
+    db.connect()
+    db.curs.execute("UPDATE tRace SET race_date = NULL, season = NULL;")
+    db.conn.commit()
+    db.close()
+    weighted = db.predict_times(1, half_life_days=30)
+    assert weighted['predicted_time'].tolist() == db.predict_times(1)['predicted_time'].tolist()
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('October  4, 2024', '2024-10-04'),
+    ('Oct 18-19, 2024', '2024-10-18'),
+    ('Sep 30 - Oct 1, 2024', '2024-09-30'),
+    ('Sep. 1, 2024', '2024-09-01'),
+    ('Sept. 13, 2024', '2024-09-13'),
+    ('Unknown Date', None),
+])
+def test_parse_race_date(db, text, expected):
+    assert db.parse_race_date(text) == expected
+
+
+def test_season_of(db):
+    assert db.season_of('2024-10-04') == 2024
+    assert db.season_of(None) is None
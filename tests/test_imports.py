@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_does_not_load_heavy_libraries():
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import courses'], cwd=repo,
+                            capture_output=True, text=True, check=True)
+    # lines look like "import time:       123 |        456 |   pandas.core"
+    imported = {line.split('|')[-1].strip() for line in result.stderr.splitlines() if line.startswith('import time:')}
+    assert 'courses' in imported
+    for heavy in ['pandas', 'numpy', 'bs4', 'requests']:
+        assert not [name for name in imported if name == heavy or name.startswith(heavy + '.')]
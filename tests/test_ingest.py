@@ -0,0 +1,21 @@
+import sqlite3
+
+import pytest
+
+
+def test_race_without_gender_takes_it_instead_of_being_duplicated(db, race_results):
+    runners = [('Runner ' + str(i), 'SO-2', 'Elon', 1200 + i) for i in range(5)]
+    old_race = db.store_results(race_results('Invitational', 'September 14, 2024', runners[:3])) # loaded before races had a gender
+    assert db.store_results(race_results('Invitational', 'September 14, 2024', runners[3:]), 'women') == old_race
+    assert db.store_results(race_results('Invitational', 'September 14, 2024', runners), 'men') != old_race
+    races = db.see_loaded_races()
+    assert races['gender'].tolist() == ['women', 'men']
+
+
+def test_rescraping_a_race_is_refused(db, race_results):
+    runners = [('Runner ' + str(i), 'SO-2', 'Elon', 1200 + i) for i in range(5)]
+    db.store_results(race_results('Invitational', 'September 14, 2024', runners))
+    with pytest.raises(sqlite3.IntegrityError):
+        db.store_results(race_results('Invitational', 'September 14, 2024', runners), 'women')
+    races = db.see_loaded_races()
+    assert len(races) == 1 and races['gender'].isna().all() # the gender was rolled back with the rest
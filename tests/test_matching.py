@@ -0,0 +1,54 @@
+def runner_ids(db, name):
+    return db.run_query('SELECT runner_id FROM tRunner WHERE name = ?', (name,))['runner_id'].tolist()
+
+
+def test_match_key(db):
+    assert db.match_key('  José  O\'Brien-Smith ') == 'jose o brien smith'
+    assert db.match_key('William & Mary') == 'william and mary'
+    assert db.match_key('Smith, Jane', sort_words=True) == db.match_key('Jane Smith', sort_words=True)
+
+
+def test_name_grams(db):
+    assert db.name_grams('ann lee') == {' an', 'ann', 'nn ', 'n l', ' le', 'lee', 'ee '}
+
+
+def test_class_year_change_links_runner(db, race_results):
+    first = db.store_results(race_results('Invitational', 'September 14, 2023', [('Jane Smith', 'SO-2', 'Elon', 1250)]), 'women')
+    second = db.store_results(race_results('Invitational', 'September 13, 2024', [('Jane  Smith', 'JR-3', 'Elon', 1230)]), 'women')
+    runners = db.run_query('SELECT DISTINCT runner_id FROM tRaceResult WHERE race_id IN (?, ?)', (first, second))
+    assert len(runners) == 1
+
+
+def test_similar_names_stay_separate(db, race_results):
+    db.store_results(race_results('Invitational', 'September 14, 2024', [('Jon Smith', 'SO-2', 'Elon', 1500)]), 'men')
+    db.store_results(race_results('Championship', 'October 26, 2024', [('John Smith', 'SO-2', 'Elon', 1490)]), 'men')
+    assert runner_ids(db, 'Jon Smith') != runner_ids(db, 'John Smith')
+
+
+def test_same_name_at_another_school_stays_separate(db, race_results):
+    db.store_results(race_results('Invitational', 'September 14, 2024', [('Jane Smith', 'SO-2', 'Elon', 1250)]), 'women')
+    db.store_results(race_results('Championship', 'October 26, 2024', [('Jane Smith', 'SO-2', 'Davidson', 1260)]), 'women')
+    assert len(db.run_query('SELECT * FROM tRunner')) == 2
+
+
+def test_runner_already_in_race_is_not_reused(db, race_results):
+    runners = [('Jane Smith', 'SR-4', 'Elon', 1250), ('Jane Smith', 'FR-1', 'Elon', 1300)]
+    race_id = db.store_results(race_results('Invitational', 'September 14, 2024', runners), 'women')
+    assert len(db.run_query('SELECT DISTINCT runner_id FROM tRaceResult WHERE race_id = ?', (race_id,))) == 2
+
+
+def test_men_and_women_with_the_same_name_stay_separate(db, race_results):
+    runner = [('Jordan Lee', 'SO-2', 'Elon', 1250)]
+    db.store_results(race_results('Invitational', 'September 14, 2024', runner), 'women')
+    db.store_results(race_results('Invitational', 'September 14, 2024', [('Jordan Lee', 'SO-2', 'Elon', 1500)]), 'men')
+    db.store_results(race_results('Championship', 'October 26, 2024', [('Jordan Lee', 'JR-3', 'Elon', 1480)]), 'men')
+    runners = db.run_query('SELECT runner_id, gender FROM tRunner ORDER BY runner_id')
+    assert runners['gender'].tolist() == ['women', 'men']
+    assert db.run_query('SELECT COUNT(DISTINCT runner_id) AS n FROM tRaceResult')['n'][0] == 2
+
+
+def test_runner_of_unknown_gender_gets_it_from_their_next_race(db, race_results):
+    db.store_results(race_results('Invitational', 'September 14, 2023', [('Jane Smith', 'SO-2', 'Elon', 1250)]))
+    db.store_results(race_results('Invitational', 'September 13, 2024', [('Jane Smith', 'JR-3', 'Elon', 1230)]), 'women')
+    db.store_results(race_results('Invitational', 'September 13, 2024', [('Jane Smith', 'JR-3', 'Elon', 1530)]), 'men')
+    assert db.run_query('SELECT gender FROM tRunner ORDER BY runner_id')['gender'].tolist() == ['women', 'men']
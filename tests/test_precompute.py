@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import courses
+
+
+@pytest.fixture
+def loaded(db, race_results):
+    '''
+    Two races run by the same Elon runners and a third run by nobody else
+    '''
+    runners = [('Runner ' + str(i), 'SO-2', 'Elon', 1200 + 10 * i) for i in range(5)]
+    db.store_results(race_results('Course A', 'September 7, 2024', runners), 'women')
+    db.store_results(race_results('Course B', 'September 21, 2024', [(name, year, school, seconds + 30) for name, year, school, seconds in runners]), 'women')
+    db.store_results(race_results('Course C', 'October 5, 2024', [('Other ' + str(i), 'FR-1', 'Duke', 1300 + i) for i in range(5)]), 'women')
+    return db
+
+
+def stored_versions(db):
+    return db.run_query("SELECT DISTINCT data_version FROM tPrecomputed;")['data_version'].tolist()
+
+
+def test_precompute_stamps_results_with_the_data_version(loaded):
+    assert loaded.precompute(workers=2) == 3
+    assert stored_versions(loaded) == [loaded.data_version()]
+    pairs = loaded.get_precomputed('pairs', 1)
+    assert pairs['race_id_two'].tolist() == [2, 3]
+    assert pairs['NumCompared'].tolist() == [5, 0]
+    assert 'RatioSE' in pairs.columns
+    assert loaded.get_precomputed('conversions', 1) is not None
+
+
+def test_precompute_race_skips_predictions_nobody_can_make(loaded):
+    race_id, results = courses.precompute_race(loaded.path_db, 3)
+    assert race_id == 3
+    assert 'predictions' not in results and 'pairs' in results
+
+
+def test_stale_results_are_not_served(loaded, race_results, monkeypatch):
+    monkeypatch.setattr(courses, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    loaded.precompute()
+    assert loaded.get_precomputed('predictions', 1) is not None
+    loaded.store_results(race_results('Course D', 'October 19, 2024', [('Runner 0', 'SO-2', 'Elon', 1250)]), 'women')
+    assert loaded.get_precomputed('predictions', 1) is None
+    assert loaded.get_precomputed('pairs', 1) is None
+
+
+def test_nothing_is_stored_if_the_data_changes_mid_run(loaded, race_results, monkeypatch):
+    class ScrapeDuringRun(ThreadPoolExecutor):
+        def map(self, *args):
+            results = list(super().map(*args))
+            courses.CoursesDB(loaded.path_db).store_results(race_results('Course D', 'October 19, 2024', [('Runner 0', 'SO-2', 'Elon', 1250)]), 'women')
+            return results
+    monkeypatch.setattr(courses, 'ProcessPoolExecutor', ScrapeDuringRun)
+    assert loaded.precompute() == 0
+    assert stored_versions(loaded) == []
+    assert loaded.get_precomputed('conversions', 1) is None
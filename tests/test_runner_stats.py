@@ -0,0 +1,37 @@
+import pandas as pd
+
+
+def expected_stats(db):
+    '''
+    tRunnerStats recomputed from scratch with a plain GROUP BY over every result
+    '''
+    sql = '''
+    SELECT runner_id, COUNT(*) AS num_races, AVG(time) AS mean_time, MIN(time) AS best_time
+    FROM tRaceResult
+    GROUP BY runner_id
+    ORDER BY runner_id
+    ;'''
+    return db.run_query(sql)
+
+
+def test_stats_match_the_results_as_races_are_loaded(db, race_results):
+    elon = [('Runner ' + str(i), 'SO-2', 'Elon', 1200 + 10 * i) for i in range(4)]
+    races = [
+        race_results('Course B', 'October 5, 2023', [(name, year, school, seconds + 30) for name, year, school, seconds in elon[:3]]),
+        race_results('Course A', 'September 7, 2023', elon), # loaded after a later race
+        race_results('Course C', 'September 6, 2024', [(name, 'JR-3', school, seconds - 20) for name, year, school, seconds in elon[:2]] # linked by match_runner
+                     + [('Other 0', 'FR-1', 'Duke', 1300)]),
+    ]
+    for race in races:
+        db.store_results(race, 'women')
+        stats = db.run_query('SELECT runner_id, num_races, mean_time, best_time FROM tRunnerStats ORDER BY runner_id')
+        pd.testing.assert_frame_equal(stats, expected_stats(db), check_dtype=False)
+
+    roster = db.team_roster('Elon').set_index('name')
+    assert len(db.run_query('SELECT * FROM tRunner')) == 5
+    assert roster.loc['Runner 0', 'num_races'] == 3
+    assert roster.loc['Runner 0', 'best_time'] == 1180
+    assert roster.loc['Runner 0', 'latest_race'] == 'Course C'
+    assert roster.loc['Runner 2', 'latest_race'] == 'Course B' # its date is later than Course A's, which was loaded after it
+    assert roster.loc['Runner 3', 'num_races'] == 1
+    assert roster.index.tolist() == ['Runner 0', 'Runner 1', 'Runner 2', 'Runner 3'] # fastest first
@@ -0,0 +1,55 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+
+def load_two_seasons(db, race_results):
+    runners = [('Runner ' + str(i), 'SO-2', 'Elon', 1200 + i) for i in range(40)]
+    for season in (2023, 2024):
+        db.store_results(race_results('Invitational', 'September 14, ' + str(season), runners), 'women')
+        db.store_results(race_results('Championship', 'October 26, ' + str(season), runners), 'women')
+
+
+def test_frozen_season_is_still_read(db, race_results):
+    load_two_seasons(db, race_results)
+    db.freeze_season(2023)
+    assert len(db.run_query('SELECT * FROM tRaceResult')) == 160
+    assert sorted(db.see_loaded_races()['season'].tolist()) == [2023, 2023, 2024, 2024]
+    assert len(db.see_loaded_races(season=2023)) == 2
+
+
+def test_streaming_and_export_include_frozen_seasons(db, race_results, tmp_path):
+    load_two_seasons(db, race_results)
+    db.freeze_season(2023)
+    assert sum(len(chunk) for chunk in db.iter_query('SELECT * FROM tRaceResult', chunksize=50)) == 160
+
+    path = str(tmp_path / 'export.csv')
+    db.export_results(path)
+    assert len(pd.read_csv(path)) == 160
+    db.export_results(path, season=2023)
+    assert len(pd.read_csv(path)) == 80
+
+
+def test_rescraping_a_frozen_race_is_refused(db, race_results):
+    load_two_seasons(db, race_results)
+    db.freeze_season(2023)
+    runners = [('Runner 1', 'SO-2', 'Elon', 1201)]
+    with pytest.raises(ValueError):
+        db.store_results(race_results('Invitational', 'September 14, 2023', runners), 'women')
+    assert len(db.see_loaded_races()) == 4
+
+
+def test_foreign_keys_are_checked_with_frozen_seasons_attached(db, race_results):
+    load_two_seasons(db, race_results)
+    db.freeze_season(2023)
+    db.connect()
+    assert db.curs.execute("PRAGMA foreign_keys;").fetchall()[0][0] == 1
+    with pytest.raises(sqlite3.IntegrityError):
+        db.curs.execute("INSERT INTO main.tRaceResult (runner_id, race_id, raw_time, time, place) VALUES (9999, 1, '1:00', 60, 1);")
+    db.close()
+
+    # a new race still links to the runners' results in the frozen season
+    race_id = db.store_results(race_results('Invitational', 'September 13, 2025', [('Runner 1', 'SO-2', 'Elon', 1190)]), 'women')
+    stats = db.run_query('SELECT num_races, latest_race_id FROM tRunnerStats JOIN tRunner USING (runner_id) WHERE name = ?', ('Runner 1',))
+    assert stats.iloc[0].tolist() == [5, race_id]
@@ -0,0 +1,40 @@
+import os
+import threading
+import time
+
+from courses import CoursesDB
+
+
+def test_write_lock_can_be_taken_again(db):
+    with db.write_lock():
+        db.drop_all_tables(are_you_sure=True) # takes it too
+        db.build_tables()
+    assert db.data_version() == 3
+
+
+def test_writes_wait_for_a_staged_rebuild(db, race_results):
+    runners = [('Runner ' + str(i), 'SO-2', 'Elon', 1200 + i) for i in range(5)]
+    db.store_results(race_results('Invitational', 'September 14, 2024', runners), 'women')
+    other = CoursesDB(db.path_db) # another writer, like a notebook next to the dashboard
+
+    loader = threading.Thread(target=lambda: other.store_results(race_results('Championship', 'October 26, 2024', runners), 'women'))
+    with db.staged() as stage:
+        loader.start()
+        time.sleep(0.3) # the loader would have finished by now if it didn't wait
+        assert loader.is_alive()
+        stage.drop_all_tables(are_you_sure=True)
+        stage.build_tables()
+    loader.join()
+
+    # the load ran after the rebuild was copied back instead of being overwritten by it
+    assert db.see_loaded_races()['race'].tolist() == ['Championship']
+
+
+def test_staged_leaves_no_files_behind_and_uses_wal(db, race_results):
+    db.store_results(race_results('Invitational', 'September 14, 2024', [('Runner 0', 'SO-2', 'Elon', 1200)]), 'women')
+    with db.staged() as stage:
+        stage.drop_all_tables(are_you_sure=True)
+        stage.build_tables()
+    assert not [name for name in os.listdir(os.path.dirname(db.path_db)) if 'staging' in name]
+    assert db.run_query('PRAGMA journal_mode')['journal_mode'][0] == 'wal'
+    assert db.see_loaded_races().empty